@@ -0,0 +1,145 @@
+import re
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+import numpy as np
+import pandas as pd
+
+EPOCH = datetime(1970, 1, 1)
+HOUR = timedelta(hours=1)
+
+class MessageAnalytics:
+    """
+    Running counters behind the message analytics tables.
+
+    Rows are added page by page while the crawl is in progress, so the top
+    hashtags, URLs, domains, forward counts and hourly volume are ready as soon
+    as the last page lands. Albums are counted once, by the first row seen for
+    each Grouped ID, matching the Grouped ID deduplication of the messages table.
+    """
+
+    def __init__(self, top_n=50):
+        self.top_n = top_n
+        self.hashtags = Counter()
+        self.urls = Counter()
+        self.domains = Counter()
+        self.forwards = Counter()  # (channel, origin username) -> forwards
+        self.hourly = defaultdict(Counter)  # channel -> {hour index since the epoch: messages}
+        self._seen_groups = set()
+
+    def add_rows(self, rows):
+        for row in rows:
+            grouped_id = row["Grouped ID"]
+            if grouped_id != "Not Available":
+                if grouped_id in self._seen_groups:
+                    continue
+                self._seen_groups.add(grouped_id)
+
+            self.hashtags.update(row["Hashtags"])
+            for url in row["URLs Shared"]:
+                self.urls[re.sub(r"[),]+$", "", re.sub(r"^https?://(www\.)?", "", url)).rstrip(".,)").lower()] += 1
+                netloc = urlparse(url).netloc
+                if netloc:
+                    self.domains[re.sub(r"[^\w.-]+$", "", re.sub(r"^www\.", "", netloc)).lower()] += 1
+
+            origin = row["Origin Username"]
+            if row["Is Forward"] and origin and origin not in ("Unknown", "Not Available"):
+                self.forwards[(row["Channel"], origin)] += 1
+
+            message_datetime = row["Message DateTime (UTC)"]
+            if isinstance(message_datetime, datetime):
+                self.hourly[row["Channel"]][(message_datetime - EPOCH) // HOUR] += 1
+
+    def _top(self, counter, column):
+        return pd.DataFrame(counter.items(), columns=[column, "Count"]).sort_values(by="Count", ascending=False).head(self.top_n)
+
+    def top_hashtags(self):
+        return self._top(self.hashtags, "Hashtag")
+
+    def top_urls(self):
+        return self._top(self.urls, "URL")
+
+    def top_domains(self):
+        return self._top(self.domains, "Domain")
+
+    def forward_counts(self):
+        """Forwards per origin (rows) and channel (columns), with a Total Forwards column."""
+        fwd_counts_df = pd.DataFrame(
+            [(channel, origin, count) for (channel, origin), count in self.forwards.items()],
+            columns=["Channel", "Origin Username", "Count"],
+        )
+        fwd_counts_df = fwd_counts_df.pivot(index="Origin Username", columns="Channel", values="Count").fillna(0)
+
+        # Add "Total Forwards" column & sort
+        fwd_counts_df["Total Forwards"] = fwd_counts_df.sum(axis=1)
+        return fwd_counts_df.sort_values(by="Total Forwards", ascending=False).reset_index()
+
+    def volume(self, start_date=None, end_date=None):
+        """Hourly, daily, weekly and monthly volume frames (see build_volume_rollups)."""
+        return build_volume_rollups(self.hourly, start_date, end_date)
+
+# Bucket label for each granularity, computed from contiguous timestamps (hours, or days above "Hour").
+ROLLUP_BUCKETS = {
+    "Hour": lambda hours: hours,
+    "Date": lambda days: days.floor("D"),
+    # Weeks end on Monday, so they are reported by their Tuesday start.
+    "Week": lambda days: days.to_period("W-MON").start_time,
+    "Year-Month": lambda days: days.to_period("M").start_time,
+}
+
+# Longest span, in days, that still gets an hourly frame; beyond it the frame is too big to keep or chart.
+HOURLY_MAX_DAYS = 31
+
+def _dense_counts(hourly_counts, channels, first, n, per):
+    """Sums each channel's hourly counts into `n` buckets of `per` hours from bucket `first`; one column per channel."""
+    matrix = np.zeros((n, len(channels)), dtype=np.int64)
+    for column, channel in enumerate(channels):
+        buckets = np.fromiter(hourly_counts[channel].keys(), dtype=np.int64) // per - first
+        counts = np.fromiter(hourly_counts[channel].values(), dtype=np.int64)
+        in_range = (buckets >= 0) & (buckets < n)
+        matrix[:, column] = np.bincount(buckets[in_range], weights=counts[in_range], minlength=n).astype(np.int64)
+    return matrix
+
+def _rollup(matrix, stamps, column, channels):
+    labels = np.asarray(ROLLUP_BUCKETS[column](stamps))
+    # Stamps are contiguous and labels non-decreasing, so each bucket is one run of rows.
+    starts = np.concatenate(([0], np.flatnonzero(labels[1:] != labels[:-1]) + 1)) if len(labels) else np.array([], dtype=np.int64)
+    values = np.add.reduceat(matrix, starts, axis=0) if len(labels) else matrix
+    frame = pd.DataFrame(values, index=pd.DatetimeIndex(labels[starts], name=column), columns=pd.Index(channels, name="Channel"))
+    return frame.reset_index()
+
+def build_volume_rollups(hourly_counts, start_date=None, end_date=None, max_hourly_days=HOURLY_MAX_DAYS):
+    """
+    Builds chart-ready message volume frames from per-channel hourly counts.
+
+    `hourly_counts` maps channel -> {hour index since the epoch: messages}.
+    They are summed into a dense day-by-channel count matrix covering
+    start_date..end_date (or the data's own span), and the weekly and monthly
+    frames are each a single np.add.reduceat over it. Returns a dict keyed by
+    "Hour", "Date", "Week" and "Year-Month"; each frame has that column
+    followed by one count column per channel, with no gaps in time. The
+    hourly frame is only built for spans of up to `max_hourly_days` days and
+    is None for longer ones.
+    """
+    channels = sorted(hourly_counts)
+    all_hours = [hour for counts in hourly_counts.values() for hour in counts]
+    if not all_hours:
+        return {column: pd.DataFrame(columns=[column]) for column in ROLLUP_BUCKETS}
+
+    first_day = min(all_hours) // 24 if start_date is None else (pd.Timestamp(start_date) - EPOCH).days
+    last_day = max(all_hours) // 24 if end_date is None else (pd.Timestamp(end_date) - EPOCH).days
+    n_days = max(0, last_day - first_day + 1)
+
+    days = pd.date_range(start=EPOCH + timedelta(days=first_day), periods=n_days, freq="D")
+    daily = _dense_counts(hourly_counts, channels, first_day, n_days, 24)
+    rollups = {column: _rollup(daily, days, column, channels) for column in ("Date", "Week", "Year-Month")}
+
+    if n_days <= max_hourly_days:
+        first_hour = min(all_hours) if start_date is None else first_day * 24
+        last_hour = max(all_hours) if end_date is None else last_day * 24 + 23
+        n_hours = max(0, last_hour - first_hour + 1)
+        hours = pd.date_range(start=EPOCH + first_hour * HOUR, periods=n_hours, freq="h")
+        rollups["Hour"] = _rollup(_dense_counts(hourly_counts, channels, first_hour, n_hours, 1), hours, "Hour", channels)
+    else:
+        rollups["Hour"] = None
+    return {column: rollups[column] for column in ROLLUP_BUCKETS}
@@ -0,0 +1,72 @@
+"""
+Times merge_participants (message-derived + API participants) on synthetic
+groups of growing size. Run from the repository root:
+
+    python benchmarks/participants_merge.py [--sizes 10000 100000 1000000] [--legacy]
+
+Half of the API members also appear in the message-derived rows. With
+--legacy, the old iterrows loop is timed too (slow above ~100k members).
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fetch_participants import merge_participants
+
+def make_inputs(n_members):
+    rng = np.random.default_rng(0)
+    user_ids = rng.choice(10 * n_members, size=n_members, replace=False)
+    api_df = pd.DataFrame({
+        "User ID": user_ids,
+        "Deleted": False,
+        "Is Bot": rng.random(n_members) < 0.01,
+        "Access Hash": rng.integers(0, 2**62, size=n_members),
+        "First Name": [f"First {i}" for i in range(n_members)],
+        "Last Name": "No Last Name",
+        "Username": [f"user{i}" for i in range(n_members)],
+        "Status": "UserStatusRecently()",
+        "Last Seen": "Not Available",
+        "group": 1,
+    })
+    participants = {
+        int(user_id): {"User ID": int(user_id), "First Name": "From Messages", "Username": "Not Available"}
+        for user_id in user_ids[: n_members // 2]
+    }
+    return participants, api_df
+
+def legacy_merge(participants, api_df):
+    participants = dict(participants)
+    for _, row in api_df.iterrows():
+        user_id = row.get("User ID")
+        if user_id not in participants:
+            participants[user_id] = row.to_dict()
+    return pd.DataFrame(list(participants.values()))
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 200_000, 500_000, 1_000_000])
+    parser.add_argument("--legacy", action="store_true", help="also time the old iterrows merge")
+    args = parser.parse_args()
+
+    print(f"{'members':>10} {'merge (s)':>10} {'us/member':>10} {'legacy (s)':>11}")
+    for n_members in args.sizes:
+        participants, api_df = make_inputs(n_members)
+        merged, elapsed = timed(merge_participants, participants, api_df)
+        assert len(merged) == n_members and merged["User ID"].is_unique
+        legacy = ""
+        if args.legacy:
+            _, legacy_elapsed = timed(legacy_merge, participants, api_df)
+            legacy = f"{legacy_elapsed:.3f}"
+        print(f"{n_members:>10} {elapsed:>10.3f} {elapsed / n_members * 1e6:>10.2f} {legacy:>11}")
+
+if __name__ == "__main__":
+    main()
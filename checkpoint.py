@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import date, datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: checkpoints are only locked against crawls in the same process.
+    fcntl = None
+
+# Define the checkpoint directory path
+CHECKPOINT_DIR = ".tgforge_checkpoints"
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    return str(value)
+
+def _decode(obj):
+    if "$datetime" in obj:
+        return datetime.fromisoformat(obj["$datetime"])
+    if "$date" in obj:
+        return date.fromisoformat(obj["$date"])
+    return obj
+
+# State paths of the checkpoints held by a crawl in this process (see CrawlCheckpoint.acquire).
+_held = set()
+_held_lock = threading.Lock()
+
+class CrawlCheckpoint:
+    """
+    On-disk cursor for one channel crawl, so an interrupted run can resume.
+
+    Rows are appended to a JSON-lines file and the cursor (offset ID and any
+    extra crawl state) is rewritten atomically after every append. The cursor
+    records how many bytes of the rows file it covers, so rows written just
+    before a crash but after the last cursor update are discarded on load.
+
+    Units of work that finish between cursor updates (comment threads) are
+    recorded with `mark_done` in a separate append-only log instead, one line
+    per unit with its rows, so finishing one does not rewrite the cursor. On
+    load their rows are returned with the others and their keys are in `done`;
+    a line cut short by a crash is dropped.
+    The file name is derived from the crawl parameters: only a rerun with the
+    same channel, date bounds and options picks the checkpoint up.
+
+    Two crawls with the same parameters (e.g. two jobs started at once) must
+    not share the files, so a crawl takes the checkpoint with `acquire` first.
+    If another crawl holds it, acquire returns False and every method becomes
+    a no-op: that crawl runs without resuming or checkpointing.
+    """
+
+    def __init__(self, kind, channel_name, start_date=None, end_date=None, directory=CHECKPOINT_DIR, **options):
+        key = json.dumps([kind, channel_name.strip(), start_date, end_date, options], default=_encode, sort_keys=True)
+        name = f"{kind}_{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+        self.directory = directory
+        self.state_path = os.path.join(directory, f"{name}.json")
+        self.rows_path = os.path.join(directory, f"{name}.jsonl")
+        self.done_path = os.path.join(directory, f"{name}.done.jsonl")
+        self.rows_written = 0
+        self.saved_at = None  # UTC time of the last save, once loaded or saved
+        self.done = set()  # keys passed to mark_done, once loaded
+        self._rows_bytes = 0
+        self._done_bytes = 0
+        self._held = False
+        self._lock_file = None
+
+    def acquire(self):
+        """Takes the checkpoint for this crawl; returns False if another crawl, here or in another process, holds it."""
+        with _held_lock:
+            if self.state_path in _held:
+                return False
+            os.makedirs(self.directory, exist_ok=True)
+            lock_file = open(f"{self.state_path}.lock", "a")
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    lock_file.close()
+                    return False
+            _held.add(self.state_path)
+        self._lock_file = lock_file
+        self._held = True
+        return True
+
+    def release(self):
+        """Lets other crawls use the checkpoint again."""
+        if not self._held:
+            return
+        with _held_lock:
+            _held.discard(self.state_path)
+            self._lock_file.close()  # also drops the flock
+        self._lock_file = None
+        self._held = False
+
+    def load(self):
+        """Returns (state, rows) from a previous run, or (None, []) if there is nothing to resume."""
+        if not self._held:
+            return None, []
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f, object_hook=_decode)
+        except (OSError, ValueError):
+            return None, []
+
+        rows = []
+        try:
+            if state["rows_bytes"] or os.path.exists(self.rows_path):
+                with open(self.rows_path, "r+b") as f:
+                    f.truncate(state["rows_bytes"])
+                    f.seek(0)
+                    for line in f:
+                        rows.append(json.loads(line, object_hook=_decode))
+        except (OSError, ValueError):
+            return None, []
+
+        done = set()
+        done_bytes = 0
+        try:
+            with open(self.done_path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line, object_hook=_decode)
+                    except ValueError:
+                        break  # cut short by a crash; it and anything after it are redone
+                    done.add(entry["key"])
+                    rows.extend(entry["rows"])
+                    done_bytes += len(line)
+        except OSError:
+            pass
+
+        self.rows_written = len(rows)
+        self.done = done
+        self._rows_bytes = state["rows_bytes"]
+        self._done_bytes = done_bytes
+        self.saved_at = state.get("saved_at")
+        return state["cursor"], rows
+
+    def save(self, rows, **cursor):
+        """Appends `rows` and records `cursor` as the point to resume from."""
+        if not self._held:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if self._done_bytes == 0 and os.path.exists(self.done_path):
+            # A crawl that starts over must not inherit the previous run's finished units.
+            os.truncate(self.done_path, 0)
+        if rows:
+            with open(self.rows_path, "ab") as f:
+                f.truncate(self._rows_bytes)
+                for row in rows:
+                    f.write(json.dumps(row, default=_encode).encode("utf-8") + b"\n")
+                self._rows_bytes = f.tell()
+            self.rows_written += len(rows)
+
+        self.saved_at = datetime.utcnow().replace(microsecond=0)
+        state = {"cursor": cursor, "rows_bytes": self._rows_bytes, "rows_written": self.rows_written, "saved_at": self.saved_at}
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, default=_encode)
+        os.replace(tmp_path, self.state_path)
+
+    def mark_done(self, key, rows):
+        """Records that the unit of work `key` finished with `rows`, without rewriting the cursor."""
+        if not self._held:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.done_path, "ab") as f:
+            f.truncate(self._done_bytes)
+            f.write(json.dumps({"key": key, "rows": rows}, default=_encode).encode("utf-8") + b"\n")
+            self._done_bytes = f.tell()
+        self.rows_written += len(rows)
+
+    def clear(self):
+        """Removes the checkpoint once the crawl has finished."""
+        if not self._held:
+            return
+        for path in (self.state_path, self.rows_path, self.done_path):
+            if os.path.exists(path):
+                os.remove(path)
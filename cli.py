@@ -0,0 +1,149 @@
+"""
+Runs TGForge fetches without Streamlit, e.g. from cron or on a worker box,
+and writes the results to CSV files. Run from the repository root:
+
+    python cli.py CHANNELS_FILE --session NAME --api-id ID --api-hash HASH \
+        [--fetch messages forwards participants channel_info] [--output DIR]
+
+CHANNELS_FILE lists one channel per line (blank lines and lines starting
+with # are skipped; commas also separate channels). The session must already
+be authorized: `python telegram_client.py NAME API_ID API_HASH`. The API ID
+and hash may also come from the TG_API_ID and TG_API_HASH environment
+variables. Progress is logged to stderr. Ctrl+C cancels the running fetch,
+keeps what it collected and still writes the outputs; a second Ctrl+C quits.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import sys
+from datetime import date
+import pandas as pd
+from telegram_client import ClientPool, connect_pool, create_client, disconnect_shared_clients
+from fetch_channel import fetch_channel_data
+from fetch_forwards import fetch_forwards
+from fetch_messages import fetch_messages
+from fetch_participants import SEARCH_PREFIXES, fetch_participants
+from message_store import MessageStore
+from progress import ConsoleReporter
+from rate_limiter import set_cancel_event
+
+FETCHES = ["channel_info", "messages", "forwards", "participants"]
+
+def read_channel_list(path):
+    """Returns the channel names in `path`, one per line or comma-separated."""
+    channels = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                channels.extend(name.strip() for name in line.split(",") if name.strip())
+    return channels
+
+def write_frames(output_dir, frames, reporter):
+    """Writes each name -> DataFrame (or list of rows) in `frames` to `<output_dir>/<name>.csv`, skipping None."""
+    os.makedirs(output_dir, exist_ok=True)
+    for name, frame in frames.items():
+        if frame is None:
+            continue  # e.g. hourly volume, which is only built for short date ranges
+        path = os.path.join(output_dir, f"{name}.csv")
+        pd.DataFrame(frame).to_csv(path, index=False)
+        reporter.write(f"Wrote {path}")
+
+async def run(args, reporter):
+    client = create_client(args.api_id, args.api_hash, args.session)
+    await client.connect()
+    if not await client.is_user_authorized():
+        raise SystemExit(f"Session '{args.session}' is not authorized; run: python telegram_client.py {args.session} API_ID API_HASH")
+
+    channels = read_channel_list(args.channels)
+    crawler = client
+    if args.sessions:
+        crawler, skipped = await connect_pool(args.api_id, args.api_hash, client, args.sessions)
+        if skipped:
+            reporter.error(f"Skipping sessions that are not authorized: {', '.join(skipped)}")
+
+    try:
+        for fetch in args.fetch:
+            if reporter.cancelled():
+                break
+            reporter.write(f"Fetching {fetch} for {len(channels)} channels...")
+            if fetch == "channel_info":
+                channel_data = await fetch_channel_data(client, channels, concurrency=args.concurrency, reporter=reporter)
+                write_frames(args.output, {"channel_info": channel_data}, reporter)
+            elif fetch == "messages":
+                result = await fetch_messages(crawler, channels, args.start_date, args.end_date, include_comments=args.comments,
+                                              concurrency=args.concurrency, reply_concurrency=args.reply_concurrency,
+                                              store=MessageStore() if args.store else None, reporter=reporter, resume=args.resume)
+                names = ["messages", "top_hashtags", "top_urls", "top_domains", "forward_counts",
+                         "daily_volume", "weekly_volume", "monthly_volume", "hourly_volume"]
+                write_frames(args.output, dict(zip(names, result)), reporter)
+                if isinstance(crawler, ClientPool):
+                    write_frames(args.output, {"account_throughput": crawler.throughput()}, reporter)
+            elif fetch == "forwards":
+                forwards_df, forward_counts = await fetch_forwards(client, channels, args.start_date, args.end_date, reporter=reporter)
+                write_frames(args.output, {"forwards": forwards_df, "forwards_counts": forward_counts}, reporter)
+            elif fetch == "participants":
+                participants_df, _, _, group_counts = await fetch_participants(
+                    client, channels, method=args.participant_method, start_date=args.start_date, end_date=args.end_date,
+                    sink=args.sink, search_concurrency=args.search_concurrency, search_prefixes=args.search_prefixes, reporter=reporter,
+                )
+                counts = [{"Group": group, "Reported": counts[0], "Collected": counts[1]} for group, counts in group_counts.items()]
+                write_frames(args.output, {"participants": participants_df, "participant_counts": counts}, reporter)
+    finally:
+        if isinstance(crawler, ClientPool):
+            await crawler.close()
+            await disconnect_shared_clients()
+        else:
+            await client.disconnect()
+
+async def main_async(args, reporter):
+    # The first Ctrl+C cancels the fetch like the UI's Cancel button: requests in flight are aborted.
+    cancel_event = asyncio.Event()
+    set_cancel_event(cancel_event)
+
+    def cancel():
+        if reporter.cancel_requested:
+            raise KeyboardInterrupt
+        reporter.write("Cancelling; writing what was collected so far (press Ctrl+C again to quit)...")
+        reporter.cancel_requested = True
+        cancel_event.set()
+
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGINT, cancel)
+    except NotImplementedError:
+        pass  # Windows: Ctrl+C quits immediately.
+    await run(args, reporter)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("channels", help="file listing the channels, one per line")
+    parser.add_argument("--session", required=True, help="name of an authorized session file")
+    parser.add_argument("--api-id", type=int, default=os.environ.get("TG_API_ID"))
+    parser.add_argument("--api-hash", default=os.environ.get("TG_API_HASH"))
+    parser.add_argument("--sessions", nargs="+", default=[], help="extra authorized sessions to crawl messages with")
+    parser.add_argument("--fetch", nargs="+", choices=FETCHES, default=["messages"])
+    parser.add_argument("--output", default="tgforge_output", help="directory the CSV files are written to")
+    parser.add_argument("--start-date", type=date.fromisoformat, help="YYYY-MM-DD")
+    parser.add_argument("--end-date", type=date.fromisoformat, help="YYYY-MM-DD")
+    parser.add_argument("--no-comments", dest="comments", action="store_false", help="skip comment threads")
+    parser.add_argument("--concurrency", type=int, default=1, help="channels crawled (or looked up) in parallel")
+    parser.add_argument("--reply-concurrency", type=int, default=5, help="comment threads fetched in parallel per channel")
+    parser.add_argument("--store", action="store_true", help="sync messages incrementally through the local message store")
+    parser.add_argument("--no-resume", dest="resume", action="store_false", help="discard saved progress from an interrupted messages fetch and start over")
+    parser.add_argument("--participant-method", choices=["default", "search", "messages"], default="default")
+    parser.add_argument("--sink", choices=["memory", "csv", "sqlite"], default="memory", help="where participants are streamed")
+    parser.add_argument("--search-concurrency", type=int, default=4)
+    parser.add_argument("--search-prefixes", default=SEARCH_PREFIXES, help="characters the search partitions start with (default: Latin letters and digits)")
+    args = parser.parse_args()
+    if args.api_id is None or not args.api_hash:
+        parser.error("--api-id and --api-hash (or TG_API_ID and TG_API_HASH) are required")
+
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())  # Windows fix
+    reporter = ConsoleReporter()
+    asyncio.run(main_async(args, reporter))
+    reporter.write(f"Done; {reporter.row_count()} rows collected.")
+
+if __name__ == "__main__":
+    main()
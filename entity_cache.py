@@ -0,0 +1,160 @@
+import re
+import sqlite3
+from datetime import datetime, timedelta
+from telethon.errors import ChannelInvalidError, ChannelPrivateError
+from telethon.tl.types import Channel, Chat, InputPeerChannel, InputPeerChat, InputPeerUser, User
+from rate_limiter import limiter_for, until_cancelled
+
+# Define the entity cache file path
+ENTITY_CACHE_PATH = "tgforge_entities.db"
+
+def normalize_username(name):
+    """Returns the lowercase username behind '@name', 't.me/name' or 'name', or None for anything else (IDs, invite links)."""
+    name = re.sub(r"^(https?://)?(www\.)?(t|telegram)\.me/", "", str(name).strip()).lstrip("@").rstrip("/")
+    return name.lower() if re.fullmatch(r"[A-Za-z][A-Za-z0-9_]{3,}", name) else None
+
+class EntityCache:
+    """
+    Disk-backed username -> (peer ID, access hash, type) cache.
+
+    Resolving a username (ResolveUsername) is one of Telegram's most heavily
+    flood-limited calls, while fetching a peer by ID and access hash is cheap.
+    Access hashes are only valid for the account that received them, so entries
+    are keyed by (account ID, username). Entries expire after `ttl` because
+    usernames can move to a different chat.
+    """
+
+    def __init__(self, path=ENTITY_CACHE_PATH, ttl=timedelta(days=7)):
+        self.path = path
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entities (
+                    account_id INTEGER NOT NULL,
+                    username TEXT NOT NULL,
+                    peer_id INTEGER NOT NULL,
+                    access_hash INTEGER,
+                    type TEXT NOT NULL,
+                    resolved_at TEXT NOT NULL,
+                    PRIMARY KEY (account_id, username)
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, account_id, username):
+        """Returns the cached input peer for `username`, or None if missing or expired."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT peer_id, access_hash, type, resolved_at FROM entities WHERE account_id = ? AND username = ?",
+                (account_id, username),
+            ).fetchone()
+        if row is None:
+            return None
+        peer_id, access_hash, peer_type, resolved_at = row
+        if datetime.utcnow() - datetime.fromisoformat(resolved_at) > self.ttl:
+            return None
+        if peer_type == "channel":
+            return InputPeerChannel(peer_id, access_hash)
+        if peer_type == "user":
+            return InputPeerUser(peer_id, access_hash)
+        return InputPeerChat(peer_id)
+
+    def put(self, account_id, username, entity):
+        if isinstance(entity, Channel):
+            peer_type = "channel"
+        elif isinstance(entity, User):
+            peer_type = "user"
+        elif isinstance(entity, Chat):
+            peer_type = "chat"
+        else:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?, ?)",
+                (account_id, username, entity.id, getattr(entity, "access_hash", None), peer_type, datetime.utcnow().isoformat()),
+            )
+
+    def invalidate(self, account_id, username):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entities WHERE account_id = ? AND username = ?", (account_id, username))
+
+class CreationDateCache:
+    """
+    Disk-backed channel ID -> creation date cache, stored next to the entity cache.
+
+    A channel's first post never changes, so entries never expire and are
+    shared by all accounts.
+    """
+
+    def __init__(self, path=ENTITY_CACHE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS creation_dates (
+                    channel_id INTEGER PRIMARY KEY,
+                    first_message_date TEXT NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, channel_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT first_message_date FROM creation_dates WHERE channel_id = ?", (channel_id,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, channel_id, first_message_date):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO creation_dates VALUES (?, ?)", (channel_id, first_message_date))
+
+def _usernames(entity):
+    names = [getattr(entity, "username", None)] + [u.username for u in getattr(entity, "usernames", None) or []]
+    return {name.lower() for name in names if name}
+
+_default_cache = None
+_default_creation_dates = None
+
+def get_entity_cache():
+    """Returns the process-wide EntityCache shared by all fetchers."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = EntityCache()
+    return _default_cache
+
+def get_creation_date_cache():
+    """Returns the process-wide CreationDateCache."""
+    global _default_creation_dates
+    if _default_creation_dates is None:
+        _default_creation_dates = CreationDateCache()
+    return _default_creation_dates
+
+async def resolve_entity(client, channel_name, cache=None):
+    """
+    Drop-in replacement for `client.get_entity(channel_name)` that avoids
+    ResolveUsername when the username was resolved recently. A cached peer that
+    Telegram rejects (ChannelInvalidError, ChannelPrivateError), or whose chat no
+    longer carries the username, is dropped and the username is resolved again.
+    """
+    limiter = limiter_for(client)
+    username = normalize_username(channel_name)
+    if username is None:
+        return await limiter.call(client.get_entity, channel_name)
+
+    cache = cache or get_entity_cache()
+    account_id = (await until_cancelled(client.get_me(input_peer=True))).user_id
+    input_peer = cache.get(account_id, username)
+    if input_peer is not None:
+        try:
+            entity = await limiter.call(client.get_entity, input_peer)
+            if username in _usernames(entity):
+                return entity
+        except (ChannelInvalidError, ChannelPrivateError, ValueError):
+            pass
+        cache.invalidate(account_id, username)
+
+    entity = await limiter.call(client.get_entity, channel_name)
+    cache.put(account_id, username, entity)
+    return entity
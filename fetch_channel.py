@@ -1,73 +1,176 @@
+import asyncio
 from telethon import functions
+from telethon.errors import FloodWaitError, MultiError
+from rate_limiter import limiter_for
+from entity_cache import get_creation_date_cache, resolve_entity
+from progress import StreamlitReporter
 
-async def get_first_valid_message_date(client, channel):
-    """Finds the date of the earliest available user-generated message in a channel."""
+def is_user_generated(message):
+    return message is not None and not message.action and bool(message.text or message.media)
+
+async def get_first_valid_message_date(client, channel, probe_size=100, parallel_probes=4, cache=None):
+    """
+    Finds the date of the earliest available user-generated message in a channel.
+
+    Message IDs are probed upwards from 1 with get_messages(ids=[...]), and
+    the lowest ID that is neither deleted (None) nor a service message wins.
+    The first window of `probe_size` IDs finds the post for almost every
+    channel in a single call. If it misses, the next `parallel_probes`
+    windows are fetched concurrently. Only after that is the rest of the
+    history paged 100 messages at a time, since history paging skips long
+    deleted gaps for free. Found dates are cached per channel ID on disk for
+    good.
+    """
+    cache = cache or get_creation_date_cache()
+    limiter = limiter_for(client)
     try:
-        async for message in client.iter_messages(channel, reverse=True):
-            if message and not message.action:
-                if message.text or message.media:
+        cached = cache.get(channel.id)
+        if cached:
+            return cached
+
+        first_id = 1
+        for windows in (1, parallel_probes):
+            starts = [first_id + i * probe_size for i in range(windows)]
+            pages = await asyncio.gather(*(limiter.call(client.get_messages, channel, ids=list(range(start, start + probe_size))) for start in starts))
+            for messages in pages:
+                for message in messages:
+                    if is_user_generated(message):
+                        cache.put(channel.id, message.date.isoformat())
+                        return message.date.isoformat()
+            first_id += windows * probe_size
+
+        # Nothing in the probed windows: page up through the rest of the history, oldest first.
+        offset_id = first_id - 1
+        while True:
+            messages = await limiter.call(client.get_messages, channel, limit=100, offset_id=offset_id, reverse=True)
+            if not messages:
+                return "No user-generated messages found"
+            for message in messages:
+                if is_user_generated(message):
+                    cache.put(channel.id, message.date.isoformat())
                     return message.date.isoformat()
-        return "No user-generated messages found"
+            offset_id = messages[-1].id
     except Exception as e:
         return f"Error fetching first message: {e}"
 
-async def fetch_channel_data(client, channel_list):
-    """Fetches and formats information for multiple Telegram channels."""
-    results = []
-    for channel_name in channel_list:
-        try:
-            channel = await client.get_entity(channel_name)
-            result = await client(functions.channels.GetFullChannelRequest(channel=channel))
-            first_message_date = await get_first_valid_message_date(client, channel)
-            chat = result.chats[0]
-
-            title = chat.title
-            description = result.full_chat.about.strip() if result.full_chat.about else "No Description"
-            participants_count = result.full_chat.participants_count if hasattr(result.full_chat, "participants_count") else "Not Available"
-
-            # Extract usernames correctly
+def build_channel_info(result, first_message_date):
+    """Formats a GetFullChannelRequest result into the channel info dict shown in the UI."""
+    chat = result.chats[0]
+
+    title = chat.title
+    description = result.full_chat.about.strip() if result.full_chat.about else "No Description"
+    participants_count = result.full_chat.participants_count if hasattr(result.full_chat, "participants_count") else "Not Available"
+
+    # Extract usernames correctly
+    try:
+        if chat.username:
+            primary_username = chat.username
+            backup_usernames = "None"
+        elif chat.usernames:
+            active_usernames = [u.username for u in chat.usernames if u.active]
+            primary_username = active_usernames[0] if active_usernames else "No Username"
+            backup_usernames = ", ".join(active_usernames[1:]) if len(active_usernames) > 1 else "None"
+        else:
+            primary_username = "No Username"
+            backup_usernames = "None"
+    except Exception as e:
+        primary_username = "No Username"
+        backup_usernames = "None"
+
+    url = f"https://t.me/{primary_username}" if primary_username != "No Username" else "No public URL available"
+    chat_type = "Channel" if chat.broadcast else "Group"
+    chat_id = chat.id
+    access_hash = chat.access_hash
+    restricted = "Yes" if chat.restricted else "No"
+    scam = "Yes" if chat.scam else "No"
+    verified = "Yes" if chat.verified else "No"
+
+    channel_info = {
+        "Title": title,
+        "Description": description,
+        "Number of Participants": participants_count,
+        "Channel Creation Date": first_message_date,
+        "Primary Username": f"@{primary_username}",
+        "Backup Usernames": backup_usernames,
+        "URL": url,
+        "Chat Type": chat_type,
+        "Chat ID": chat_id,
+        "Access Hash": access_hash,
+        "Restricted": restricted,
+        "Scam": scam,
+        "Verified": verified,
+    }
+    return channel_info
+
+async def fetch_channel_data(client, channel_list, concurrency=5, batch_size=10, reporter=None):
+    """
+    Fetches and formats information for multiple Telegram channels.
+
+    Channels are resolved `concurrency` at a time. Their GetFullChannelRequests
+    go out `batch_size` per call, and Telethon sends each batch in a single
+    container. The creation-date lookups then run concurrently as well. Each
+    channel reports on its own progress line as soon as it is done, and the
+    results keep the input order.
+    """
+    limiter = limiter_for(client)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    # Reserve the progress lines up front so they stay in input order.
+    reporter = reporter or StreamlitReporter()
+    progress_lines = [reporter.line() for _ in channel_list]
+    results = [None] * len(channel_list)
+
+    async def resolve(index, channel_name):
+        async with semaphore:
+            try:
+                return await resolve_entity(client, channel_name)
+            except Exception as e:
+                results[index] = {"Error": f"Could not fetch info for {channel_name}: {e}"}
+                progress_lines[index].error(results[index]["Error"])
+
+    channels = await asyncio.gather(*(resolve(i, name) for i, name in enumerate(channel_list)))
+
+    # Batch the full-info requests for every channel that resolved.
+    resolved = [i for i, channel in enumerate(channels) if channel is not None]
+    full_results = {}
+    for start in range(0, len(resolved), max(1, batch_size)):
+        pending = resolved[start:start + max(1, batch_size)]
+        for attempt in range(limiter.max_retries + 1):
+            requests = [functions.channels.GetFullChannelRequest(channel=channels[i]) for i in pending]
             try:
-                if chat.username:
-                    primary_username = chat.username
-                    backup_usernames = "None"
-                elif chat.usernames:
-                    active_usernames = [u.username for u in chat.usernames if u.active]
-                    primary_username = active_usernames[0] if active_usernames else "No Username"
-                    backup_usernames = ", ".join(active_usernames[1:]) if len(active_usernames) > 1 else "None"
+                responses = await limiter.call(client, requests)
+                errors = [None] * len(pending)
+            except MultiError as e:
+                # Some requests in the container failed; keep the ones that succeeded.
+                responses, errors = e.results, e.exceptions
+            except Exception as e:
+                responses, errors = [None] * len(pending), [e] * len(pending)
+            # limiter.call only sees a flood wait raised on its own; inside a MultiError,
+            # back the limiter off here and send the flood-waited requests again.
+            flood_waits = [error.seconds for error in errors if isinstance(error, FloodWaitError)]
+            retry = []
+            for i, response, error in zip(pending, responses, errors):
+                if isinstance(error, FloodWaitError) and attempt < limiter.max_retries:
+                    retry.append(i)
+                elif error is not None or response is None:
+                    results[i] = {"Error": f"Could not fetch info for {channel_list[i]}: {error}"}
+                    progress_lines[i].error(results[i]["Error"])
                 else:
-                    primary_username = "No Username"
-                    backup_usernames = "None"
+                    full_results[i] = response
+            if not retry:
+                break
+            limiter.on_flood_wait(max(flood_waits) + 1)
+            pending = retry
+
+    async def finish(index):
+        async with semaphore:
+            try:
+                first_message_date = await get_first_valid_message_date(client, channels[index])
+                results[index] = build_channel_info(full_results[index], first_message_date)
+                reporter.add_rows([results[index]])
+                progress_lines[index].write(f"Fetched channel info for **{results[index]['Title']}**")
             except Exception as e:
-                primary_username = "No Username"
-                backup_usernames = "None"
-
-            url = f"https://t.me/{primary_username}" if primary_username != "No Username" else "No public URL available"
-            chat_type = "Channel" if chat.broadcast else "Group"
-            chat_id = chat.id
-            access_hash = chat.access_hash
-            restricted = "Yes" if chat.restricted else "No"
-            scam = "Yes" if chat.scam else "No"
-            verified = "Yes" if chat.verified else "No"
-
-            channel_info = {
-                "Title": title,
-                "Description": description,
-                "Number of Participants": participants_count,
-                "Channel Creation Date": first_message_date,
-                "Primary Username": f"@{primary_username}",
-                "Backup Usernames": backup_usernames,
-                "URL": url,
-                "Chat Type": chat_type,
-                "Chat ID": chat_id,
-                "Access Hash": access_hash,
-                "Restricted": restricted,
-                "Scam": scam,
-                "Verified": verified,
-            }
-
-            results.append(channel_info)
-
-        except Exception as e:
-            results.append({"Error": f"Could not fetch info for {channel_name}: {e}"})
-
-    return results
\ No newline at end of file
+                results[index] = {"Error": f"Could not fetch info for {channel_list[index]}: {e}"}
+                progress_lines[index].error(results[index]["Error"])
+
+    await asyncio.gather(*(finish(i) for i in full_results))
+    return results
@@ -0,0 +1,56 @@
+import pandas as pd
+from fetch_messages import fetch_messages
+from fetch_forwards import ForwardRows, build_forwards_frame
+from fetch_participants import SenderRegistry, fetch_default_participants, merge_participants
+from progress import StreamlitReporter
+
+async def fetch_combined(client, channel_list, start_date=None, end_date=None, include_comments=True, concurrency=1, reply_concurrency=5, reporter=None):
+    """
+    Fills the Messages, Forwards and Participants (via messages) results from a
+    single crawl of each channel, instead of paging through the history once
+    per result.
+
+    Every page of the messages crawl is also handed to a ForwardRows and a
+    SenderRegistry extractor for that channel. With `include_comments`, the
+    fetched comment threads feed the sender registry too, so commenters are
+    included as in the Via Messages method. Returns a tuple of the three
+    results, each shaped like the return value of fetch_messages,
+    fetch_forwards and fetch_participants(method="messages").
+    """
+    forwards = {}
+    senders = {}
+    reporter = reporter or StreamlitReporter()
+
+    def extractors_for(channel_name):
+        forwards[channel_name] = ForwardRows(channel_name)
+        senders[channel_name] = SenderRegistry()
+        return [forwards[channel_name], senders[channel_name]]
+
+    messages_result = await fetch_messages(
+        client, channel_list, start_date, end_date, include_comments=include_comments,
+        concurrency=concurrency, reply_concurrency=reply_concurrency, extractors_for=extractors_for, reporter=reporter,
+    )
+    forwards_result = build_forwards_frame([row for channel_name in channel_list if channel_name in forwards for row in forwards[channel_name].rows])
+
+    # Supplement the message senders with the API member list, as the Via Messages method does.
+    all_dfs = []
+    total_fetched = 0
+    group_counts = {}
+    for channel_name in channel_list:
+        if channel_name not in senders:
+            continue
+        if reporter.cancelled():
+            # Keep the senders collected before the cancel, without the member list.
+            api_df, api_reported_count = pd.DataFrame(), None
+        else:
+            api_df, api_reported_count = await fetch_default_participants(client, channel_name, reporter=reporter)
+        reported_count = api_reported_count if api_reported_count not in [None, 0] else "Not Available"
+        df = merge_participants(senders[channel_name].participants, api_df)
+        total_fetched += len(df)
+        group_counts[channel_name] = (reported_count, len(df))
+        if not df.empty:
+            all_dfs.append(df)
+    participants_df = pd.concat(all_dfs, ignore_index=True) if all_dfs else pd.DataFrame()
+    participants_result = (participants_df, 0, total_fetched, group_counts)
+
+    return messages_result, forwards_result, participants_result
@@ -1,11 +1,15 @@
+import asyncio
 import pandas as pd
-import time
-import re
-from collections import Counter
-from urllib.parse import urlparse
 from telethon.errors import FloodWaitError
-import streamlit as st
 from tenacity import retry, wait, stop_after_attempt, retry_if_exception_type, RetryCallState
+from rate_limiter import AccountThrottled, FetchCancelled, limiter_for
+from telegram_client import ClientPool
+from entity_cache import resolve_entity
+from utils import extract_hashtags, extract_urls
+from message_stream import MessagePager
+from checkpoint import CrawlCheckpoint
+from analytics import MessageAnalytics
+from progress import StreamlitReporter
 
 def wait_for_flood(retry_state: RetryCallState) -> float:
     # If the exception is a FloodWaitError, use its recommended wait time plus a small buffer.
@@ -14,313 +18,418 @@ def wait_for_flood(retry_state: RetryCallState) -> float:
         return exc.seconds + 1
     return 1  # Fallback wait time
 
+def build_message_row(message, channel, channel_name):
+    """Converts a channel post into a row dict."""
+    message_datetime = message.date.replace(tzinfo=None) if message.date else "Not Available"
+    message_type = type(message.media).__name__ if message.media else "Text"
+    is_forward = bool(message.forward)
+    urls_shared = extract_urls(message)
+    hashtags = extract_hashtags(message)
+    reactions = sum([reaction.count for reaction in message.reactions.results]) if message.reactions else 0
+    geo_location = f"{message.geo.lat}, {message.geo.long}" if message.geo else "None"
+
+    # Determine sender info
+    if message.sender:
+        sender_user_id = getattr(message.sender, "id", "Not Available")
+        sender_username = getattr(message.sender, "username", "Not Available")
+    else:
+        # If there's no sender, assume this is a channel post.
+        sender_user_id = getattr(channel, "id", "Not Available")
+        sender_username = getattr(channel, "username", "Not Available")
+
+    message_url = f"https://t.me/{channel.username}/{message.id}" if hasattr(channel, "username") else "No URL available"
+
+    return {
+        "Channel": channel_name,
+        "Message ID": message.id,
+        "Parent Message ID": None,  # This is for main messages; replies will have an actual Parent Message ID
+        "Sender User ID": sender_user_id,
+        "Sender Username": sender_username,
+        "Message DateTime (UTC)": message_datetime,
+        "Text": message.text,
+        "Message Type": message_type,
+        "Is Forward": is_forward,
+        "Origin Username": get_origin_username(message),
+        "Geo-location": geo_location,
+        "Hashtags": hashtags,
+        "URLs Shared": urls_shared,
+        "Reactions": reactions,
+        "Message URL": message_url,
+        "Views": message.views if message.views else None,
+        "Forwards": message.forwards if message.forwards else None,
+        "Replies": message.replies.replies if message.replies else "No Replies",
+        "Reply To Message Snippet": None,
+        "Reply To Message Sender": None,
+        "Grouped ID": str(message.grouped_id) if message.grouped_id else "Not Available",
+    }
+
+def thread_parent(message):
+    """
+    Keeps only the fields reply rows need from a post, so the Telethon message
+    does not have to stay in memory while its thread waits in the reply queue.
+    """
+    return {
+        "id": message.id,
+        "snippet": message.text[:100] + "..." if message.text else "No Text",
+        "sender": message.sender.username if message.sender and hasattr(message.sender, "username") else "Not Available",
+        "origin": get_origin_username(message),
+    }
+
+def build_reply_row(reply, parent, channel, channel_name):
+    """Converts a comment on the post described by `parent` (see thread_parent) into a row dict."""
+    reply_datetime = reply.date.replace(tzinfo=None) if reply.date else "Not Available"
+
+    if reply.sender:
+        reply_user_id = getattr(reply.sender, "id", "Not Available")
+        reply_username = getattr(reply.sender, "username", "Not Available")
+    else:
+        # For a reply from a channel, use the channel's details
+        reply_user_id = getattr(channel, "id", "Not Available")
+        reply_username = getattr(channel, "username", "Not Available")
+
+    return {
+        "Channel": channel_name,
+        "Message ID": reply.id,
+        "Parent Message ID": parent["id"],  # Reference to original message
+        "Sender User ID": reply_user_id,
+        "Sender Username": reply_username,
+        "Message DateTime (UTC)": reply_datetime,
+        "Text": reply.text,
+        "Message Type": type(reply.media).__name__ if reply.media else "Text",
+        "Is Forward": bool(reply.forward),
+        "Origin Username": parent["origin"],
+        "Geo-location": f"{reply.geo.lat}, {reply.geo.long}" if reply.geo else "None",
+        "Hashtags": extract_hashtags(reply),
+        "URLs Shared": extract_urls(reply),
+        "Reactions": sum([reaction.count for reaction in reply.reactions.results]) if reply.reactions else 0,
+        "Message URL": f"https://t.me/{channel.username}/{reply.id}" if hasattr(channel, "username") else "No URL available",
+        "Views": reply.views if reply.views else None,
+        "Forwards": reply.forwards if reply.forwards else None,
+        "Replies": reply.replies.replies if reply.replies else "No Replies",
+        "Reply To Message Snippet": parent["snippet"],
+        "Reply To Message Sender": parent["sender"],
+        "Grouped ID": str(reply.grouped_id) if reply.grouped_id else "Not Available",
+    }
+
+def get_origin_username(message):
+    """Returns the username of the chat a message was forwarded from."""
+    original_username = "Not Available"
+    if message.forward:
+        try:
+            if message.forward.chat and hasattr(message.forward.chat, "username"):
+                original_username = message.forward.chat.username
+        except AttributeError:
+            original_username = "Unknown"
+    return original_username
+
+async def fetch_channel_messages(client, channel_name, progress_text, start_date=None, end_date=None, include_comments=True, reply_concurrency=5, store=None, analytics=None, extractors=(), handoff=False, reporter=None, resume=True):
+    """
+    Crawls a single channel and returns its message (and reply) rows.
+
+    Comment threads are fetched by `reply_concurrency` workers that run alongside
+    the page loop. Posts are queued as soon as their page arrives and the workers
+    always pick the busiest queued thread first.
+
+    With a MessageStore, only posts newer than the last synced ID are fetched
+    (when the stored history covers the request); the new rows are merged into
+    the store and the returned rows are read back from it.
+
+    Rows and the crawl cursor are checkpointed to disk after every page, and
+    each finished comment thread is appended to the checkpoint's log, so
+    rerunning with the same parameters after a crash or a cancel resumes where
+    the previous run stopped; posts published in the meantime are fetched from
+    the top first. `resume=False` discards the checkpoint and starts over. A
+    cancel aborts requests already in flight (see rate_limiter.FetchCancelled)
+    and returns the rows collected so far.
+
+    Rows are added to `analytics` (a MessageAnalytics) as each page and thread
+    completes. With a store, the rows read back from it are added instead.
+
+    Pages come from a MessagePager. Each page and each fetched comment thread
+    is also passed to `extractors` (objects with add_messages(messages, channel)
+    and add_replies(replies, channel)), so other result sets can be filled from
+    the same crawl. Such a crawl does not resume from a checkpoint, because
+    the extractors would miss the saved pages.
+
+    If the account is throttled (AccountThrottled, see ClientPool), the error is
+    raised with the checkpoint left in place, so another account can resume the
+    crawl. Such a takeover passes `handoff=True`: the rows it
+    resumes from were already added to `analytics` by the previous attempt.
+    """
+    limit = 100
+    limiter = limiter_for(client)
+    reporter = reporter or StreamlitReporter()
+    messages_data = []
+    try:
+        channel = await resolve_entity(client, channel_name)
+        progress_text.write(f"Processing channel: **{channel_name}**")
+        offset_id = 0
+        post_rows = []
+    except ValueError:
+        progress_text.error(f"Channel '**{channel_name}**' does not exist. Skipping.")
+        return messages_data
+    except FetchCancelled:
+        progress_text.write(f"Canceled before **{channel_name}** was crawled.")
+        return messages_data
+
+    # Incremental sync: only ask for posts above the highest ID already in the store.
+    min_id = 0
+    incremental = store is not None and store.can_sync_incrementally(channel.id, start_date, include_comments)
+    if incremental:
+        min_id = store.sync_state(channel.id)[0]
+        progress_text.write(f"Fetching messages newer than ID {min_id} for **{channel_name}**")
+    max_message_id = min_id
+
+    # Reply stage: (-reply count, message ID, thread parent) so the busiest threads come out first.
+    reply_queue = asyncio.PriorityQueue()
+    replies_by_parent = {}
+    pending_threads = {}  # message ID -> reply count, for threads queued but not yet fetched
+    reply_workers = []
+    throttled = []  # AccountThrottled errors raised inside reply workers
+
+    checkpoint = CrawlCheckpoint("messages", channel_name, start_date, end_date, include_comments=include_comments, min_id=min_id)
+
+    def record(rows):
+        reporter.add_rows(rows)
+        # With a store the returned rows come from the store, so they are recorded at the end.
+        if analytics is not None and store is None:
+            analytics.add_rows(rows)
+
+    def assemble():
+        # Each post is preceded by its replies, as in the original crawl order.
+        rows = []
+        for row in post_rows:
+            rows.extend(replies_by_parent.get(row["Message ID"], []))
+            rows.append(row)
+        return rows
+
+    def save_checkpoint(rows):
+        checkpoint.save(rows, offset_id=offset_id, max_message_id=max_message_id, pending_threads=list(pending_threads.items()))
+
+    async def reply_worker():
+        while True:
+            _, _, parent = await reply_queue.get()
+            if parent is None:
+                return
+            try:
+                replies = await limiter.call(client.get_messages, channel, reply_to=parent["id"], limit=100)
+                replies_by_parent[parent["id"]] = [build_reply_row(reply, parent, channel, channel_name) for reply in replies]
+                for extractor in extractors:
+                    extractor.add_replies(replies, channel)
+            except AccountThrottled as e:
+                # Leave the thread pending so the account that takes over fetches it.
+                throttled.append(e)
+                return
+            except FetchCancelled:
+                # Leave the thread pending in the checkpoint for the next run.
+                return
+            except Exception as e:
+                replies_by_parent[parent["id"]] = []
+                progress_text.write(f"Error fetching replies for message {parent['id']} in {channel_name}: {e}")
+            pending_threads.pop(parent["id"], None)
+            record(replies_by_parent[parent["id"]])
+            # Appended to the checkpoint's log; the cursor (with every pending thread) is only rewritten per page.
+            checkpoint.mark_done(parent["id"], replies_by_parent[parent["id"]])
+
+    def queue_thread(message):
+        pending_threads[message.id] = message.replies.replies
+        reply_queue.put_nowait((-message.replies.replies, message.id, thread_parent(message)))
+
+    if not checkpoint.acquire():
+        progress_text.write(f"Another job is crawling **{channel_name}** with the same settings; this crawl will not resume or save progress.")
+    if include_comments:
+        reply_workers = [asyncio.create_task(reply_worker()) for _ in range(max(1, reply_concurrency))]
+
+    try:
+        # Pick up an interrupted run of the same crawl. Extractors never saw the
+        # saved pages, so a crawl that feeds them starts over (overwriting the
+        # checkpoint) unless it is a handoff, whose extractors already did.
+        if not resume:
+            checkpoint.clear()
+        cursor, saved_rows = checkpoint.load() if resume and (handoff or not extractors) else (None, [])
+        if cursor:
+            offset_id, max_message_id = cursor["offset_id"], cursor["max_message_id"]
+            for row in saved_rows:
+                if row["Parent Message ID"] is None:
+                    post_rows.append(row)
+                else:
+                    replies_by_parent.setdefault(row["Parent Message ID"], []).append(row)
+            if not handoff:
+                record(saved_rows)
+            saved_at = f", saved {checkpoint.saved_at:%Y-%m-%d %H:%M} UTC" if checkpoint.saved_at else ""
+            progress_text.write(f"Resuming **{channel_name}** from message ID {offset_id} ({len(saved_rows)} rows already collected{saved_at})")
+            # Threads that were still queued need their parent posts again to build reply rows.
+            pending_ids = [message_id for message_id, _ in cursor["pending_threads"] if message_id not in checkpoint.done]
+            for i in range(0, len(pending_ids) if include_comments else 0, 100):
+                parents = await limiter.call(client.get_messages, channel, ids=pending_ids[i:i + 100])
+                for message in parents:
+                    if message and message.replies:
+                        queue_thread(message)
+
+            # Posts published since the checkpoint was written sit above its max_message_id,
+            # out of reach of the downward crawl; fetch them from the top first. They are only
+            # checkpointed once that pass completes, so an interrupted pass is simply redone.
+            top_pager = MessagePager(client, channel, channel_name, progress_text, start_date, end_date, 0, max_message_id, None, limit, reporter)
+            new_rows, new_threads = [], []
+            async for page in top_pager.pages():
+                for message in page:
+                    new_rows.append(build_message_row(message, channel, channel_name))
+                    if include_comments and message.replies and message.replies.replies > 0:
+                        new_threads.append(message)
+                for extractor in extractors:
+                    extractor.add_messages(page, channel)
+                del page
+            if new_rows and not top_pager.cancelled:
+                progress_text.write(f"Found {len(new_rows)} messages in **{channel_name}** posted since the checkpoint was saved")
+                for message in new_threads:
+                    queue_thread(message)
+                post_rows[:0] = new_rows
+                record(new_rows)
+                max_message_id = top_pager.max_message_id
+                save_checkpoint(new_rows)
+            del new_threads
+
+        pager = MessagePager(client, channel, channel_name, progress_text, start_date, end_date, offset_id, min_id, max_message_id, limit, reporter)
+        async for page in pager.pages():
+            page_rows = []
+            for message in page:
+                page_rows.append(build_message_row(message, channel, channel_name))
+                if include_comments and message.replies and message.replies.replies > 0:
+                    queue_thread(message)
+            for extractor in extractors:
+                extractor.add_messages(page, channel)
+
+            post_rows.extend(page_rows)
+            record(page_rows)
+            offset_id, max_message_id = pager.offset_id, pager.max_message_id
+            save_checkpoint(page_rows)
+            # Only compact rows outlive the page; drop the Telethon objects before the next request.
+            del page
+        exhausted, stopped_at_start, cancelled = pager.exhausted, pager.stopped_at_start, pager.cancelled
+
+        progress_text.write(f"Collected {len(post_rows)} messages for channel **{channel_name}.**")
+
+        # Let the workers drain whatever is still queued, then stop them.
+        if reply_workers and not cancelled:
+            progress_text.write(f"Fetching replies for {reply_queue.qsize()} remaining threads in **{channel_name}**...")
+            for _ in reply_workers:
+                reply_queue.put_nowait((float("inf"), 0, None))
+            await asyncio.gather(*reply_workers)
+            if throttled:
+                raise throttled[0]
+            # A cancel while the workers drain leaves threads pending; keep them checkpointed.
+            cancelled = bool(pending_threads)
+            if cancelled:
+                progress_text.write(f"Canceled with {len(pending_threads)} comment threads left in **{channel_name}**.")
+
+        messages_data = assemble()
+
+        if store is not None:
+            store.save_rows(channel.id, messages_data)
+            # Only advance the sync cursor when the crawl reached the bottom of the
+            # requested range; a cancelled run or an incremental run cut off by
+            # start_date would leave a gap below the new posts.
+            if not cancelled and (exhausted or (stopped_at_start and not incremental)):
+                if incremental:
+                    _, synced_from, with_comments = store.sync_state(channel.id)
+                else:
+                    synced_from, with_comments = start_date, include_comments
+                store.mark_synced(channel.id, channel_name, max_message_id, synced_from, with_comments)
+            messages_data = store.load_rows(channel.id, channel_name, start_date, end_date, include_comments)
+            if analytics is not None:
+                analytics.add_rows(messages_data)
+
+        if not cancelled:
+            checkpoint.clear()
+
+    except AccountThrottled:
+        # The checkpoint is already current (it is saved after every page and thread).
+        progress_text.write(f"Account throttled while crawling **{channel_name}**; handing the crawl to another account...")
+        raise
+    except Exception as e:
+        progress_text.write(f"Error fetching messages for {channel_name}: {e}")
+        # Keep what was collected before the error; it is already in the analytics.
+        messages_data = assemble()
+        if analytics is not None and store is not None:
+            analytics.add_rows(messages_data)
+    finally:
+        for worker in reply_workers:
+            worker.cancel()
+        checkpoint.release()
+
+    return messages_data
+
 @retry(
     retry=retry_if_exception_type(FloodWaitError),
     wait=lambda retry_state: retry_state.outcome.exception().seconds + 1 if isinstance(retry_state.outcome.exception(), FloodWaitError) else 1,
     stop=stop_after_attempt(5)
 )
     
-async def fetch_messages(client, channel_list, start_date=None, end_date=None, include_comments=True):
-    all_messages_data = []
-    limit = 1000  
-    
-    for channel_name in channel_list:
-        try:
-            channel = await client.get_entity(channel_name)
-            progress_text = st.empty()
-            progress_text.write(f"Processing channel: **{channel_name}**")
-            offset_id = 0
-            total_messages = []
-        except ValueError:
-            st.error(f"Channel '**{channel_name}**' does not exist. Skipping.")
-            continue
-
-        try:
-            while True:
-                messages = await client.get_messages(channel, limit=limit, offset_id=offset_id)
-                if not messages:
-                    progress_text.write("No more messages in this batch.")
-                    break
-                
-                # Update the progress message with a batch summary.
-                first_date = messages[0].date.replace(tzinfo=None) if messages[0].date else "Unknown"
-                last_date = messages[-1].date.replace(tzinfo=None) if messages[-1].date else "Unknown"
-                progress_text.write(f"Processing messages for **{channel_name}** from {first_date.date()} to {last_date.date()}")
-                
-                stop_fetching = False  # Flag to stop if we go before the start_date
-                
-                for message in messages:
-                    message_datetime = message.date.replace(tzinfo=None) if message.date else None
-                    # If we've reached messages older than our start_date, break out of the loop.
-                    if start_date and message_datetime and message_datetime.date() < start_date:
-                        progress_text.write("Reached messages older than the start date.")
-                        stop_fetching = True
-                        break
-                    # Only add messages within the specified range
-                    if ((not start_date or (message_datetime and message_datetime.date() >= start_date)) and 
-                        (not end_date or (message_datetime and message_datetime.date() <= end_date))):
-                        total_messages.append(message)
-                if stop_fetching:
-                    break
-
-                # Inside your while loop in fetch_messages.py:
-                offset_id = messages[-1].id if messages else offset_id
-                time.sleep(1)
-                
-                # Check if a cancel flag was set:
-                if st.session_state.get("cancel_fetch", False):
-                    progress_text.write("Canceled by user.")
-                    break
-
-            progress_text.write(f"Collected {len(total_messages)} messages for channel **{channel_name}.**")
-            
-            # Process messages
-            messages_data = []
-            for message in total_messages:
-                message_datetime = message.date.replace(tzinfo=None) if message.date else "Not Available"
-                message_type = type(message.media).__name__ if message.media else "Text"
-                is_forward = bool(message.forward)
-                urls_shared = re.findall(r"(https?://\S+)", message.text) if message.text else []
-                hashtags = [tag for tag in message.text.split() if tag.startswith("#")] if message.text else []
-                reactions = sum([reaction.count for reaction in message.reactions.results]) if message.reactions else 0
-                geo_location = f"{message.geo.lat}, {message.geo.long}" if message.geo else "None"
-                
-                # Determine sender info
-                if message.sender:
-                    sender_user_id = getattr(message.sender, "id", "Not Available")
-                    sender_username = getattr(message.sender, "username", "Not Available")
-                else:
-                    # If there's no sender, assume this is a channel post.
-                    sender_user_id = getattr(channel, "id", "Not Available")
-                    sender_username = getattr(channel, "username", "Not Available")
-                    
-                original_username = "Not Available"
-                if is_forward:
-                    try:
-                        if message.forward.chat and hasattr(message.forward.chat, "username"):
-                            original_username = message.forward.chat.username
-                    except AttributeError:
-                        original_username = "Unknown"
-
-                message_url = f"https://t.me/{channel.username}/{message.id}" if hasattr(channel, "username") else "No URL available"
-
-                message_data = {
-                    "Channel": channel_name,
-                    "Message ID": message.id,
-                    "Parent Message ID": None,  # This is for main messages; replies will have an actual Parent Message ID
-                    "Sender User ID": sender_user_id,
-                    "Sender Username": sender_username,                 
-                    "Message DateTime (UTC)": message_datetime,
-                    "Text": message.text,
-                    "Message Type": message_type,
-                    "Is Forward": is_forward,
-                    "Origin Username": original_username,
-                    "Geo-location": geo_location,
-                    "Hashtags": hashtags,
-                    "URLs Shared": urls_shared,
-                    "Reactions": reactions,
-                    "Message URL": message_url,
-                    "Views": message.views if message.views else None,
-                    "Forwards": message.forwards if message.forwards else None,
-                    "Replies": message.replies.replies if message.replies else "No Replies",
-                    "Reply To Message Snippet": None,
-                    "Reply To Message Sender": None,
-                    "Grouped ID": str(message.grouped_id) if message.grouped_id else "Not Available",
-                }
-                
-                # Fetch Replies (Nested Comments)
-                if include_comments and message.replies and message.replies.replies > 0:
-                    try:
-                        replies = await client.get_messages(channel, reply_to=message.id, limit=100)
-                        progress_text.write(f" Processing replies for message ID {message.id}")
-                        for reply in replies:
-                            reply_datetime = reply.date.replace(tzinfo=None) if reply.date else "Not Available"
-                
-                            if reply.sender:
-                                reply_user_id = getattr(reply.sender, "id", "Not Available")
-                                reply_username = getattr(reply.sender, "username", "Not Available")
-                            
-                            else:
-                                # For a reply from a channel, use the channel's details
-                                reply_user_id = getattr(channel, "id", "Not Available")
-                                reply_username = getattr(channel, "username", "Not Available")
-
-                            reply_data = {
-                                "Channel": channel_name,
-                                "Message ID": reply.id,
-                                "Parent Message ID": message.id,  # Reference to original message
-                                "Sender User ID": reply_user_id,
-                                "Sender Username": reply_username,
-                                "Message DateTime (UTC)": reply_datetime,
-                                "Text": reply.text,
-                                "Message Type": type(reply.media).__name__ if reply.media else "Text",
-                                "Is Forward": bool(reply.forward),
-                                "Origin Username": original_username,
-                                "Geo-location": f"{reply.geo.lat}, {reply.geo.long}" if reply.geo else "None",
-                                "Hashtags": [tag for tag in reply.text.split() if tag.startswith("#")] if reply.text else [],
-                                "URLs Shared": re.findall(r"(https?://\S+)", reply.text) if reply.text else [],
-                                "Reactions": sum([reaction.count for reaction in reply.reactions.results]) if reply.reactions else 0,
-                                "Message URL": f"https://t.me/{channel.username}/{reply.id}" if hasattr(channel, "username") else "No URL available",
-                                "Views": reply.views if reply.views else None,
-                                "Forwards": reply.forwards if reply.forwards else None,
-                                "Replies": reply.replies.replies if reply.replies else "No Replies",
-                                "Reply To Message Snippet": message.text[:100] + "..." if message.text else "No Text",
-                                "Reply To Message Sender": message.sender.username if message.sender and hasattr(message.sender, "username") else "Not Available",
-                                "Grouped ID": str(reply.grouped_id) if reply.grouped_id else "Not Available",
-                            }
-                            
-                            messages_data.append(reply_data)
-                    except Exception as e:
-                        progress_text.write(f"Error fetching replies for message {message.id} in {channel_name}: {e}")
-                messages_data.append(message_data)
-            all_messages_data.extend(messages_data)
-
-        except Exception as e:
-            progress_text.write(f"Error fetching messages for {channel_name}: {e}")
+async def fetch_messages(client, channel_list, start_date=None, end_date=None, include_comments=True, concurrency=1, reply_concurrency=5, store=None, extractors_for=None, reporter=None, resume=True):
+    """
+    Fetches messages from a list of channels and builds the analytics tables.
+
+    Up to `concurrency` channels are crawled at once. Each channel writes to its
+    own progress line, and rows are merged in input order, so the output is the
+    same as a sequential run. With `include_comments`, each channel fetches up
+    to `reply_concurrency` comment threads at a time. Passing a MessageStore
+    turns each channel crawl into an incremental sync against the local store.
+    `extractors_for(channel_name)` may return extra extractors to feed from
+    each channel's crawl (see fetch_channel_messages). `resume=False` starts
+    every channel over instead of resuming an interrupted crawl.
+
+    The hourly volume frame is None when the data spans more than
+    analytics.HOURLY_MAX_DAYS days.
+
+    `client` may also be a ClientPool: each channel is then crawled by the
+    account the pool picks, at least one channel per account at a time, and
+    moves to another account if its account gets throttled.
+    """
+    pool = client if isinstance(client, ClientPool) else None
+    # Reserve the progress lines up front so they stay in input order.
+    reporter = reporter or StreamlitReporter()
+    progress_lines = [reporter.line() for _ in channel_list]
+    semaphore = asyncio.Semaphore(max(1, concurrency, len(pool) if pool else 1))
+    analytics = MessageAnalytics()
+
+    async def crawl(channel_name, progress_text):
+        extractors = extractors_for(channel_name) if extractors_for else ()
+        async with semaphore:
+            if pool is None:
+                return await fetch_channel_messages(client, channel_name, progress_text, start_date, end_date, include_comments, reply_concurrency, store, analytics, extractors, reporter=reporter, resume=resume)
+            attempts = 0
+
+            async def work(account):
+                nonlocal attempts
+                attempts += 1
+                return await fetch_channel_messages(account, channel_name, progress_text, start_date, end_date, include_comments, reply_concurrency, store, analytics, extractors, handoff=attempts > 1, reporter=reporter, resume=resume or attempts > 1)
+
+            try:
+                return await pool.run(work)
+            except FetchCancelled:
+                # Cancelled while every account was in a flood wait.
+                progress_text.write(f"Canceled before **{channel_name}** was crawled.")
+                return []
+
+    results = await asyncio.gather(*(crawl(name, line) for name, line in zip(channel_list, progress_lines)))
+    all_messages_data = [row for channel_rows in results for row in channel_rows]
 
     # Convert to DataFrame
     df = pd.DataFrame(all_messages_data)
     
-    # Deduplicate based on Grouped ID
-    dedup_df = df[df["Grouped ID"] != "Not Available"].drop_duplicates(subset=["Grouped ID"], keep="first")
-    df = pd.concat([df[df["Grouped ID"] == "Not Available"], dedup_df]).sort_values(by=["Channel", "Message DateTime (UTC)"]).reset_index(drop=True)
-    
-    # Generate Analytics (Hashtags, URLs, Volume Trends)
-    def process_hashtags(df):
-        df["Hashtags"] = df["Hashtags"].apply(lambda x: x if isinstance(x, list) else [])
-        hashtags_list = df["Hashtags"].explode().dropna().tolist()
-        hashtags_counter = Counter(hashtags_list)
-        return pd.DataFrame(hashtags_counter.items(), columns=["Hashtag", "Count"]).sort_values(by="Count", ascending=False).head(50)
-
-    def process_urls(df):
-        df["URLs Shared"] = df["URLs Shared"].apply(lambda x: x if isinstance(x, list) else [])
-
-        # Flatten the list of URLs, remove unwanted trailing characters, and normalize
-        urls_list = [
-            re.sub(r"[),]+$", "", re.sub(r"^https?://(www\.)?", "", url)).rstrip(".,)").lower()
-            for url in df["URLs Shared"].explode().dropna().tolist()
-        ]
-        # Count occurrences of each cleaned URL
-        urls_counter = Counter(urls_list)
-        # Convert the counter to a DataFrame, sort by count, and limit to top 50
-        return pd.DataFrame(urls_counter.items(), columns=["URL", "Count"]).sort_values(by="Count", ascending=False).head(50)
-    
-    # Process Forward Counts
-    def process_forwards(df):
-        fwd_df = df[df["Is Forward"] == True]  # Filter forwarded messages
-        fwd_df = fwd_df[~fwd_df["Origin Username"].isin(["Unknown", "Not Available"])]  # Exclude unknown sources
-
-        # Generate forward counts
-        fwd_counts_df = fwd_df.groupby(["Channel", "Origin Username"]).size().reset_index(name="Count")
-        fwd_counts_df = fwd_counts_df.pivot(index="Origin Username", columns="Channel", values="Count").fillna(0)
-
-        # Add "Total Forwards" column & sort
-        fwd_counts_df["Total Forwards"] = fwd_counts_df.sum(axis=1)
-        fwd_counts_df = fwd_counts_df.sort_values(by="Total Forwards", ascending=False).reset_index()
-
-        return fwd_counts_df
-
-    # Process domain counts
-    def process_domains(df):
-        df["URLs Shared"] = df["URLs Shared"].apply(lambda x: x if isinstance(x, list) else [])
-        domains_list = [
-            re.sub(r"[^\w.-]+$", "", re.sub(r"^www\.", "", urlparse(url).netloc)).lower()
-            for url in df["URLs Shared"].explode().dropna().tolist()
-            if urlparse(url).netloc
-        ]
-        domains_counter = Counter(domains_list)
-        return pd.DataFrame(domains_counter.items(), columns=["Domain", "Count"]).sort_values(by="Count", ascending=False).head(50)
-
-    def generate_daily_volume(df, start_date=None, end_date=None):
-        """Generates daily message counts per channel with date range control."""
-        df["Message DateTime (UTC)"] = pd.to_datetime(df["Message DateTime (UTC)"])
-        df["Date"] = df["Message DateTime (UTC)"].dt.date
-
-        # Count messages per day per channel
-        daily_counts = df.groupby(["Date", "Channel"]).size().reset_index(name="Total")
-        daily_counts["Date"] = pd.to_datetime(daily_counts["Date"])
-
-        # Determine the full range based on user selection or data min/max
-        if start_date is None:
-            range_start = daily_counts["Date"].min()
-        else:
-            range_start = pd.Timestamp(start_date)
-        if end_date is None:
-            range_end = daily_counts["Date"].max()
-        else:
-            range_end = pd.Timestamp(end_date)
-
-        # Generate full date range (all days between range_start and range_end)
-        full_range = pd.date_range(start=range_start, end=range_end, freq="D")
-
-        # Pivot the data and reindex to fill missing days with 0
-        daily_counts_pivot = daily_counts.pivot(index="Date", columns="Channel", values="Total").fillna(0)
-        daily_counts_pivot = daily_counts_pivot.reindex(full_range, fill_value=0)
-        daily_counts_pivot = daily_counts_pivot.reset_index().rename(columns={"index": "Date"})
-        return daily_counts_pivot
-
-    def generate_weekly_volume(df, start_date=None, end_date=None):
-        """Generates weekly message counts per channel with missing weeks filled with 0 and date range control."""
-        df["Message DateTime (UTC)"] = pd.to_datetime(df["Message DateTime (UTC)"])
-        # Compute the week (using weeks ending on Monday but reporting Tuesday as the start)
-        df["Week"] = df["Message DateTime (UTC)"].dt.to_period("W-MON").dt.start_time
-
-        weekly_counts = df.groupby(["Week", "Channel"]).size().reset_index(name="Total")
-        weekly_counts["Week"] = pd.to_datetime(weekly_counts["Week"])
-
-        if start_date is None:
-            range_start = weekly_counts["Week"].min()
-        else:
-            range_start = pd.Timestamp(start_date)
-        if end_date is None:
-            range_end = weekly_counts["Week"].max()
-        else:
-            range_end = pd.Timestamp(end_date)
-
-        # Generate full weekly range using the same weekday as computed (W-TUE)
-        full_range = pd.date_range(start=range_start, end=range_end, freq="W-TUE")
-
-        weekly_counts_pivot = weekly_counts.pivot(index="Week", columns="Channel", values="Total")
-        weekly_counts_pivot = weekly_counts_pivot.reindex(full_range, fill_value=0)
-        weekly_counts_pivot = weekly_counts_pivot.reset_index().rename(columns={"index": "Week"})
-        return weekly_counts_pivot
-
+    # Deduplicate based on Grouped ID (there are no columns at all if nothing was collected, e.g. after an early cancel)
+    if not df.empty:
+        dedup_df = df[df["Grouped ID"] != "Not Available"].drop_duplicates(subset=["Grouped ID"], keep="first")
+        df = pd.concat([df[df["Grouped ID"] == "Not Available"], dedup_df]).sort_values(by=["Channel", "Message DateTime (UTC)"]).reset_index(drop=True)
     
-    def generate_monthly_volume(df, start_date=None, end_date=None):
-        """Generates monthly message counts per channel with date range control."""
-        df["Message DateTime (UTC)"] = pd.to_datetime(df["Message DateTime (UTC)"])
-        # Compute the first day of the month
-        df["Year-Month"] = df["Message DateTime (UTC)"].dt.to_period("M").dt.start_time
-
-        monthly_counts = df.groupby(["Year-Month", "Channel"]).size().reset_index(name="Total")
-        monthly_counts["Year-Month"] = pd.to_datetime(monthly_counts["Year-Month"])
-
-        if start_date is None:
-            range_start = monthly_counts["Year-Month"].min()
-        else:
-            range_start = pd.Timestamp(start_date)
-        if end_date is None:
-            range_end = monthly_counts["Year-Month"].max()
-        else:
-            range_end = pd.Timestamp(end_date)
-
-        # Generate full monthly range using Month Start frequency
-        full_range = pd.date_range(start=range_start, end=range_end, freq="MS")
-
-        monthly_counts_pivot = monthly_counts.pivot(index="Year-Month", columns="Channel", values="Total").fillna(0)
-        monthly_counts_pivot = monthly_counts_pivot.reindex(full_range, fill_value=0)
-        monthly_counts_pivot = monthly_counts_pivot.reset_index().rename(columns={"index": "Year-Month"})
-        return monthly_counts_pivot
-
     # Compute top analytics
-    top_domains_df = process_domains(df)
-    forward_counts_df = process_forwards(df)
-    top_hashtags_df = process_hashtags(df)
-    top_urls_df = process_urls(df)
-    
+    top_domains_df = analytics.top_domains()
+    forward_counts_df = analytics.forward_counts()
+    top_hashtags_df = analytics.top_hashtags()
+    top_urls_df = analytics.top_urls()
+
     # Add Volume Analysis
-    daily_volume = generate_daily_volume(df, start_date, end_date)
-    weekly_volume = generate_weekly_volume(df, start_date, end_date)
-    monthly_volume = generate_monthly_volume(df, start_date, end_date)
+    volume = analytics.volume(start_date, end_date)
+    hourly_volume, daily_volume, weekly_volume, monthly_volume = volume["Hour"], volume["Date"], volume["Week"], volume["Year-Month"]
 
-    return df, top_hashtags_df, top_urls_df, top_domains_df, forward_counts_df, daily_volume, weekly_volume, monthly_volume
+    return df, top_hashtags_df, top_urls_df, top_domains_df, forward_counts_df, daily_volume, weekly_volume, monthly_volume, hourly_volume
@@ -1,57 +1,277 @@
+import asyncio
 import pandas as pd
-import time
-from telethon import functions
+from telethon import functions, types
 from telethon.errors import FloodWaitError, RpcCallFailError
 from telethon.tl.types import User
-import streamlit as st
+from rate_limiter import FetchCancelled, limiter_for
+from entity_cache import resolve_entity
+from message_stream import MessagePager
+from progress import StreamlitReporter
+from participant_sink import open_sink
 
-async def fetch_default_participants(client, group_name):
-    """Fetch participants of a Telegram group using a direct API request."""
+def build_member_row(user, group_name):
+    """Builds a member record from a User returned by the participants API."""
+    return {
+        'User ID': user.id,
+        'Deleted': user.deleted,
+        'Is Bot': user.bot,
+        'Verified': user.verified,
+        'Restricted': user.restricted,
+        'Scam': user.scam,
+        'Fake': user.fake,
+        'Premium': getattr(user, 'premium', False),
+        'Access Hash': user.access_hash,
+        'First Name': user.first_name if user.first_name else 'No First Name',
+        'Last Name': user.last_name if user.last_name else 'No Last Name',
+        'Username': user.username if user.username else 'No Username',
+        'Phone': user.phone if user.phone else 'No Phone',
+        'Status': str(user.status),
+        'Timezone Info': user.status.was_online.tzinfo if hasattr(user.status, 'was_online') else 'Not Available',
+        'Restriction Reason': ', '.join(r.text for r in user.restriction_reason) if user.restriction_reason else 'None',
+        'Language Code': user.lang_code if user.lang_code else 'Unknown',
+        'Last Seen': user.status.was_online.isoformat() if hasattr(user.status, 'was_online') else 'Not Available',
+        'Profile Picture DC ID': user.photo.dc_id if user.photo else 'No DC ID',
+        'Profile Picture Photo ID': user.photo.photo_id if user.photo else 'No Photo ID',
+        group_name: 1  # Mark membership in this group
+    }
+
+async def iter_participant_pages(client, group, search="", limit=200000, page_size=200):
+    """
+    Yields pages of Users from a channel's member list, optionally filtered by `search`.
+
+    This is the GetParticipantsRequest loop behind client.iter_participants,
+    run here so every page goes through the rate limiter and a FloodWaitError
+    retries that page instead of ending the iteration. As there, members are
+    taken from `result.participants`: `result.users` also holds users the
+    records only refer to (inviters, admins who promoted or banned someone).
+    """
+    limiter = limiter_for(client)
+    offset = 0
+    while offset < limit:
+        result = await limiter.call(client, functions.channels.GetParticipantsRequest(
+            channel=group,
+            filter=types.ChannelParticipantsSearch(search),
+            offset=offset,
+            limit=min(page_size, limit - offset),
+            hash=0,
+        ))
+        if not result.participants:
+            break
+        offset += len(result.participants)
+        users = {user.id: user for user in result.users if isinstance(user, User)}
+        members = []
+        for participant in result.participants:
+            if isinstance(participant, types.ChannelParticipantLeft):
+                continue
+            if isinstance(participant, types.ChannelParticipantBanned):
+                # Banned entries point at a peer, which may be a chat rather than a user.
+                user_id = getattr(participant.peer, "user_id", None)
+            else:
+                user_id = participant.user_id
+            if user_id in users:
+                members.append(users[user_id])
+        yield members
+
+async def fetch_default_participants(client, group_name, group=None, sink="memory", progress_text=None, reporter=None):
+    """
+    Fetch participants of a Telegram group using a direct API request. Pass `group` if the entity is already resolved.
+
+    Rows are written page by page to a participant sink ("memory", "csv" or
+    "sqlite", see participant_sink.py), so counts update while the member list
+    downloads and an error near the end keeps everything collected before it.
+    """
+    limiter = limiter_for(client)
+    reporter = reporter or StreamlitReporter()
+    progress_text = progress_text or reporter.line()
+    sink = open_sink(sink, group_name)
+    reported_participants_count = 0
     try:
         print(f"Fetching participants for group: {group_name}...")
+        group = group or await resolve_entity(client, group_name)
         # Fetch full channel info to get reported members count
-        result = await client(functions.channels.GetFullChannelRequest(channel=group_name))
+        result = await limiter.call(client, functions.channels.GetFullChannelRequest(channel=group))
         reported_participants_count = result.full_chat.participants_count if hasattr(result.full_chat, "participants_count") else "Not Available"
         print(f"Reported members for {group_name}: {reported_participants_count}")
 
-        # Fetch all participants (adjust limit if needed)
-        participants = await client.get_participants(group_name, limit=200000)
-        print(f"Fetched {len(participants)} participants for {group_name}")
-
-        members_data = []
-        for user in participants:
-            user_data = {
-                'User ID': user.id,
-                'Deleted': user.deleted,
-                'Is Bot': user.bot,
-                'Verified': user.verified,
-                'Restricted': user.restricted,
-                'Scam': user.scam,
-                'Fake': user.fake,
-                'Premium': getattr(user, 'premium', False),
-                'Access Hash': user.access_hash,
-                'First Name': user.first_name if user.first_name else 'No First Name',
-                'Last Name': user.last_name if user.last_name else 'No Last Name',
-                'Username': user.username if user.username else 'No Username',
-                'Phone': user.phone if user.phone else 'No Phone',
-                'Status': str(user.status),
-                'Timezone Info': user.status.was_online.tzinfo if hasattr(user.status, 'was_online') else 'Not Available',
-                'Restriction Reason': ', '.join(r.text for r in user.restriction_reason) if user.restriction_reason else 'None',
-                'Language Code': user.lang_code if user.lang_code else 'Unknown',
-                'Last Seen': user.status.was_online.isoformat() if hasattr(user.status, 'was_online') else 'Not Available',
-                'Profile Picture DC ID': user.photo.dc_id if user.photo else 'No DC ID',
-                'Profile Picture Photo ID': user.photo.photo_id if user.photo else 'No Photo ID',
-                group_name: 1  # Mark membership in this group
-            }
-            members_data.append(user_data)
-        df = pd.DataFrame(members_data)
-        print(f"Collected data for {len(df)} members in {group_name}")
-        return df, reported_participants_count
+        # Stream the member list (adjust limit if needed); only user IDs are kept between pages.
+        seen = set()
+        async for users in iter_participant_pages(client, group, limit=200000):
+            rows = [build_member_row(user, group_name) for user in users if user.id not in seen]
+            seen.update(user.id for user in users)
+            sink.write(rows)
+            reporter.add_rows(rows)
+            progress_text.write(f"Fetched {sink.count} of {reported_participants_count} participants for **{group_name}**...")
+        print(f"Fetched {sink.count} participants for {group_name}")
+    except FetchCancelled:
+        progress_text.write(f"Canceled after {sink.count} participants of **{group_name}**.")
     except Exception as e:
         print(f"Error fetching participants for {group_name}: {e}")
-        return pd.DataFrame(), 0
+        progress_text.write(f"Error fetching participants for {group_name} after {sink.count} members: {e}")
+    finally:
+        sink.close()
+
+    df = sink.result()
+    print(f"Collected data for {len(df)} members in {group_name}")
+    return df, reported_participants_count
+
+# Default search prefixes used to split a member list into partitions.
+SEARCH_PREFIXES = "abcdefghijklmnopqrstuvwxyz0123456789"
+
+async def fetch_participants_via_search(client, group_name, concurrency=4, sink="memory", progress_text=None, search_cap=10000, max_depth=3, reporter=None, prefixes=SEARCH_PREFIXES):
+    """
+    Enumerates members of a large group by splitting the member list into
+    search partitions, working around the cap Telegram puts on plain
+    participant pagination.
+
+    The unfiltered list is fetched first. Then every character of `prefixes`
+    (Latin letters and digits by default) is searched, `concurrency`
+    partitions at a time under the client's shared rate limiter. Members whose
+    names start with none of them, e.g. in another script, are only found if
+    the unfiltered list returned them, and the final progress line says so. A partition that returns `search_cap` members or more was
+    probably cut off, so it is split again one character deeper, up to
+    `max_depth` characters. Members are deduplicated by user ID as pages
+    arrive. The progress line reports coverage against the group's reported
+    participants_count.
+    """
+    limiter = limiter_for(client)
+    reporter = reporter or StreamlitReporter()
+    progress_text = progress_text or reporter.line()
+    sink = open_sink(sink, group_name)
+    reported_participants_count = 0
+    seen = set()
+    prefixes = "".join(dict.fromkeys(char for char in prefixes.lower() if not char.isspace())) or SEARCH_PREFIXES
+
+    def report(end="..."):
+        if isinstance(reported_participants_count, int) and reported_participants_count > 0:
+            coverage = f" ({len(seen) / reported_participants_count:.1%} coverage)"
+        else:
+            coverage = ""
+        progress_text.write(f"Fetched {len(seen)} of {reported_participants_count} participants for **{group_name}**{coverage}{end}")
+
+    async def harvest(search):
+        """Fetches one partition and returns how many members it matched."""
+        matched = 0
+        async for users in iter_participant_pages(client, group, search=search):
+            matched += len(users)
+            rows = [build_member_row(user, group_name) for user in users if user.id not in seen]
+            seen.update(user.id for user in users)
+            sink.write(rows)
+            reporter.add_rows(rows)
+            report()
+        return matched
+
+    async def search_worker():
+        while True:
+            search = await partitions.get()
+            try:
+                if await harvest(search) >= search_cap and len(search) < max_depth:
+                    for prefix in prefixes:
+                        partitions.put_nowait(search + prefix)
+            except FetchCancelled:
+                pass  # The remaining partitions drain without making requests.
+            except Exception as e:
+                progress_text.write(f"Error fetching search partition '{search}' for {group_name}: {e}")
+            finally:
+                partitions.task_done()
+
+    partitions = asyncio.Queue()
+    workers = []
+    try:
+        progress_text.write(f"Fetching participants for **{group_name}** (search partitions)...")
+        group = await resolve_entity(client, group_name)
+        result = await limiter.call(client, functions.channels.GetFullChannelRequest(channel=group))
+        reported_participants_count = result.full_chat.participants_count if hasattr(result.full_chat, "participants_count") else "Not Available"
+
+        await harvest("")
+        for prefix in prefixes:
+            partitions.put_nowait(prefix)
+        workers = [asyncio.create_task(search_worker()) for _ in range(max(1, concurrency))]
+        await partitions.join()
+        if reporter.cancelled():
+            progress_text.write(f"Canceled after {len(seen)} participants of **{group_name}**.")
+        else:
+            report(f". Searched names starting with: {prefixes}. Members whose names start with other characters"
+                   " are missing unless the unfiltered list returned them.")
+    except FetchCancelled:
+        progress_text.write(f"Canceled after {len(seen)} participants of **{group_name}**.")
+    except Exception as e:
+        progress_text.write(f"Error fetching participants for {group_name} after {len(seen)} members: {e}")
+    finally:
+        for worker in workers:
+            worker.cancel()
+        sink.close()
+
+    return sink.result(), reported_participants_count
+
+def build_participant_row(user):
+    """Builds a participant record from a message sender (a User, or the chat itself for channel posts)."""
+    return {
+        "User ID": user.id,
+        "Deleted": getattr(user, "deleted", False),
+        "Is Bot": getattr(user, "bot", False),
+        "Verified": getattr(user, "verified", False),
+        "Restricted": getattr(user, "restricted", False),
+        "Scam": getattr(user, "scam", False),
+        "Fake": getattr(user, "fake", False),
+        "Premium": getattr(user, "premium", False),
+        "Access Hash": user.access_hash if hasattr(user, "access_hash") else "Not Available",
+        "First Name": user.first_name if hasattr(user, "first_name") and user.first_name else "No First Name",
+        "Last Name": user.last_name if hasattr(user, "last_name") and user.last_name else "No Last Name",
+        "Username": user.username if hasattr(user, "username") and user.username else "Not Available",
+        "Phone": user.phone if hasattr(user, "phone") and user.phone else "Not Available",
+        "Status": str(user.status) if hasattr(user, "status") and user.status else "Not Available",
+    }
+
+class SenderRegistry:
+    """
+    Extractor for MessagePager pages that collects the senders of messages and
+    comments as participant rows, keyed by user ID.
 
-async def fetch_participants_via_messages(client, group_name, start_date=None, end_date=None):
+    Senders come from the users/chats Telegram attaches to each page, so no
+    lookup is needed. Channel posts without a user sender count as the
+    channel itself. IDs of posts with replies are kept in `thread_ids`, so
+    callers that do not fetch comments themselves can fetch them afterwards.
+    """
+
+    def __init__(self):
+        self.participants = {}
+        self.thread_ids = []
+        self.messages_seen = 0
+
+    def _register(self, message, channel):
+        user = message.sender if isinstance(message.sender, User) else channel
+        if user.id not in self.participants:
+            self.participants[user.id] = build_participant_row(user)
+
+    def add_messages(self, messages, channel):
+        for message in messages:
+            if not message.date:
+                continue
+            self.messages_seen += 1
+            self._register(message, channel)
+            if message.replies and message.replies.replies > 0:
+                self.thread_ids.append(message.id)
+
+    def add_replies(self, replies, channel):
+        for reply in replies:
+            self._register(reply, channel)
+
+def merge_participants(participants, api_df):
+    """
+    Combines message-derived participants (a dict of User ID -> row) with the
+    API member list. Message-derived rows win: an API row is only added for a
+    user not seen in messages, keeping the first API row per user. The merge is
+    a single keyed isin/concat, so it stays linear in the member count.
+    """
+    message_df = pd.DataFrame(list(participants.values()))
+    if api_df.empty:
+        return message_df
+    api_only = api_df[~api_df["User ID"].isin(pd.Index(participants.keys()))].drop_duplicates(subset="User ID")
+    if message_df.empty:
+        return api_only.reset_index(drop=True)
+    return pd.concat([message_df, api_only], ignore_index=True)
+
+async def fetch_participants_via_messages(client, group_name, start_date=None, end_date=None, reporter=None):
     """
     Fetch participants from a group by collecting messages (filtered by date)
     and extracting unique senders, then supplement with API-retrieved members.
@@ -59,6 +279,10 @@ async def fetch_participants_via_messages(client, group_name, start_date=None, e
     Additionally, for each message that has replies, fetch those replies
     and extract the senders (i.e. commenters). This helps capture users who
     reply to channel posts.
+
+    The group entity is resolved once; senders are read from the entities
+    Telegram sends with each page (see SenderRegistry), so no per-message RPCs
+    are made.
     
     Returns a tuple of:
       - DataFrame with detailed participant information
@@ -66,129 +290,67 @@ async def fetch_participants_via_messages(client, group_name, start_date=None, e
       - Fetched participant count (unique users collected)
       - A dictionary mapping the group to (reported_count, fetched_count)
     """
+    limiter = limiter_for(client)
+    reporter = reporter or StreamlitReporter()
     try:
+        group = await resolve_entity(client, group_name)
+
         # First, get reported count via the API method.
         from fetch_participants import fetch_default_participants
-        api_df, api_reported_count = await fetch_default_participants(client, group_name)
+        api_df, api_reported_count = await fetch_default_participants(client, group_name, group, reporter=reporter)
         reported_count = api_reported_count if api_reported_count not in [None, 0] else "Not Available"
 
-        st.write(f"Fetching messages for group '{group_name}' for participant extraction...")
-        all_messages = []
-        offset_id = 0
-        limit = 1000
-        stop_fetching = False
+        reporter.write(f"Fetching messages for group '{group_name}' for participant extraction...")
+        # Register senders as each page arrives instead of keeping every message until the end.
+        senders = SenderRegistry()
+        await MessagePager(client, group, group_name, reporter.line(), start_date, end_date, reporter=reporter).extract(senders)
 
-        while not stop_fetching:
-            messages = await client.get_messages(group_name, limit=limit, offset_id=offset_id)
-            if not messages:
-                st.write("No more messages in batch.")
-                break
+        reporter.write(f"Total messages collected for group '{group_name}': {senders.messages_seen}")
 
-            st.write(f"Fetched {len(messages)} messages in current batch.")
-            for message in messages:
-                if not message.date:
-                    continue
-                msg_date = message.date.replace(tzinfo=None).date()
-                if end_date and msg_date > end_date:
-                    continue
-                if start_date and msg_date < start_date:
-                    stop_fetching = True
-                    break
-                all_messages.append(message)
-            if stop_fetching:
-                st.write("Reached messages older than start_date. Stopping further fetch.")
-                break
-            offset_id = messages[-1].id
-            time.sleep(1)
-            if st.session_state.get("cancel_fetch", False):
-                st.write("Fetch participants via messages cancelled by user.")
+        # Process replies (comments)
+        for message_id in senders.thread_ids:
+            if reporter.cancelled():
                 break
+            try:
+                replies = await limiter.call(client.get_messages, group, reply_to=message_id, limit=100)
+                senders.add_replies(replies, group)
+            except Exception as e:
+                reporter.write(f"Error fetching replies for message {message_id} in {group_name}: {e}")
 
-        st.write(f"Total messages collected for group '{group_name}': {len(all_messages)}")
-
-        from telethon.tl.types import User
-        participants = {}
-        # Process main messages
-        for message in all_messages:
-            if message.sender and isinstance(message.sender, User):
-                user = message.sender
-            else:
-                # For channel posts without a sender, use the group/channel entity.
-                user = await client.get_entity(group_name)
-            if user.id not in participants:
-                participants[user.id] = {
-                    "User ID": user.id,
-                    "Deleted": getattr(user, "deleted", False),
-                    "Is Bot": getattr(user, "bot", False),
-                    "Verified": getattr(user, "verified", False),
-                    "Restricted": getattr(user, "restricted", False),
-                    "Scam": getattr(user, "scam", False),
-                    "Fake": getattr(user, "fake", False),
-                    "Premium": getattr(user, "premium", False),
-                    "Access Hash": user.access_hash if hasattr(user, "access_hash") else "Not Available",
-                    "First Name": user.first_name if hasattr(user, "first_name") and user.first_name else "No First Name",
-                    "Last Name": user.last_name if hasattr(user, "last_name") and user.last_name else "No Last Name",
-                    "Username": user.username if hasattr(user, "username") and user.username else "Not Available",
-                    "Phone": user.phone if hasattr(user, "phone") and user.phone else "Not Available",
-                    "Status": str(user.status) if hasattr(user, "status") and user.status else "Not Available",
-                }
-        # Process replies (comments)
-        for message in all_messages:
-            if message.replies and message.replies.replies > 0:
-                try:
-                    replies = await client.get_messages(group_name, reply_to=message.id, limit=100)
-                    for reply in replies:
-                        if reply.sender and isinstance(reply.sender, User):
-                            r_user = reply.sender
-                        else:
-                            r_user = await client.get_entity(group_name)
-                        if r_user.id not in participants:
-                            participants[r_user.id] = {
-                                "User ID": r_user.id,
-                                "Deleted": getattr(r_user, "deleted", False),
-                                "Is Bot": getattr(r_user, "bot", False),
-                                "Verified": getattr(r_user, "verified", False),
-                                "Restricted": getattr(r_user, "restricted", False),
-                                "Scam": getattr(r_user, "scam", False),
-                                "Fake": getattr(r_user, "fake", False),
-                                "Premium": getattr(r_user, "premium", False),
-                                "Access Hash": r_user.access_hash if hasattr(r_user, "access_hash") else "Not Available",
-                                "First Name": r_user.first_name if hasattr(r_user, "first_name") and r_user.first_name else "No First Name",
-                                "Last Name": r_user.last_name if hasattr(r_user, "last_name") and r_user.last_name else "No Last Name",
-                                "Username": r_user.username if hasattr(r_user, "username") and r_user.username else "Not Available",
-                                "Phone": r_user.phone if hasattr(r_user, "phone") and r_user.phone else "Not Available",
-                                "Status": str(r_user.status) if hasattr(r_user, "status") and r_user.status else "Not Available",
-                            }
-                except Exception as e:
-                    st.write(f"Error fetching replies for message {message.id} in {group_name}: {e}")
-
-        st.write(f"Extracted {len(participants)} unique participants from messages for group '{group_name}'")
+        reporter.write(f"Extracted {len(senders.participants)} unique participants from messages for group '{group_name}'")
 
         # Merge with API-based participants without overwriting existing entries.
-        if not api_df.empty:
-            for _, row in api_df.iterrows():
-                user_id = row.get("User ID")
-                if user_id not in participants:
-                    participants[user_id] = row.to_dict()
+        df = merge_participants(senders.participants, api_df)
 
-        fetched_count = len(participants)
+        fetched_count = len(df)
         group_counts = {group_name: (reported_count, fetched_count)}
-        st.write(f"Total unique participants after merging: {fetched_count}")
+        reporter.write(f"Total unique participants after merging: {fetched_count}")
 
-        return pd.DataFrame(list(participants.values())), reported_count, fetched_count, group_counts
+        return df, reported_count, fetched_count, group_counts
 
     except Exception as e:
-        st.write(f"Error fetching participants via messages for {group_name}: {e}")
+        reporter.write(f"Error fetching participants via messages for {group_name}: {e}")
         return pd.DataFrame(), "Not Available", 0, {group_name: ("Not Available", 0)}
 
-async def fetch_participants(client, group_list, method="default", start_date=None, end_date=None):
+async def fetch_participants(client, group_list, method="default", start_date=None, end_date=None, sink="memory", search_concurrency=4, reporter=None, search_prefixes=SEARCH_PREFIXES):
     all_dfs = []
     total_reported = 0
     total_fetched = 0
     group_counts = {}
+    reporter = reporter or StreamlitReporter()
     for group in group_list:
+        if reporter.cancelled():
+            break
         if method == "default":
-            df, reported_count = await fetch_default_participants(client, group)
+            df, reported_count = await fetch_default_participants(client, group, sink=sink, reporter=reporter)
+            fetched_count = len(df)
+            total_reported += reported_count if isinstance(reported_count, int) else 0
+            total_fetched += fetched_count
+            group_counts[group] = (reported_count, fetched_count)
+            if not df.empty:
+                all_dfs.append(df)
+        elif method == "search":
+            df, reported_count = await fetch_participants_via_search(client, group, search_concurrency, sink, reporter=reporter, prefixes=search_prefixes)
             fetched_count = len(df)
             total_reported += reported_count if isinstance(reported_count, int) else 0
             total_fetched += fetched_count
@@ -196,7 +358,7 @@ async def fetch_participants(client, group_list, method="default", start_date=No
             if not df.empty:
                 all_dfs.append(df)
         elif method == "messages":
-            df, reported_count, fetched_count, counts = await fetch_participants_via_messages(client, group, start_date, end_date)
+            df, reported_count, fetched_count, counts = await fetch_participants_via_messages(client, group, start_date, end_date, reporter=reporter)
             total_fetched += fetched_count
             group_counts[group] = (reported_count, fetched_count)
             if not df.empty:
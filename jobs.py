@@ -0,0 +1,133 @@
+import asyncio
+import itertools
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from progress import JobReporter
+from rate_limiter import set_cancel_event
+
+# Seconds a finished job is kept for its session to pick up before the runner drops it.
+JOB_TTL = 3600
+
+class Job:
+    """One fetch submitted to the JobRunner, with its progress, result and status."""
+
+    def __init__(self, job_id, kind, label):
+        self.id = job_id
+        self.kind = kind
+        self.label = label
+        self.status = "running"  # running, done, failed or cancelled
+        self.reporter = JobReporter()
+        self.result = None
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+        self.future = None
+        self.cancel_event = None  # created on the job loop
+
+    @property
+    def running(self):
+        return self.status == "running"
+
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+class JobRunner:
+    """
+    Runs fetches on one long-lived event loop in a background thread.
+
+    Streamlit reruns the script on every widget interaction, so a fetch run
+    inside the script blocks the page until it finishes. Here the script only
+    submits the fetch and gets a job ID back; the fetch keeps running between
+    reruns and the UI polls `get(job_id)` for its progress and result. Telegram
+    clients are bound to the loop they connect on, so every client call,
+    including sign-in, goes through this loop (`run` for short blocking calls).
+    """
+
+    def __init__(self):
+        if sys.platform == "win32":
+            asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())  # Windows fix
+        self.loop = asyncio.new_event_loop()
+        self.jobs = {}
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tgforge-export")
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="tgforge-jobs", daemon=True)
+        self._thread.start()
+
+    def run(self, coro, timeout=None):
+        """Runs `coro` on the job loop and waits for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def submit(self, kind, label, make_coro):
+        """
+        Starts `make_coro(reporter)` on the job loop and returns the new job's ID.
+        The coroutine reports progress and partial rows through `reporter`.
+        """
+        with self._lock:
+            job = Job(next(self._ids), kind, label)
+            self.jobs[job.id] = job
+        job.future = asyncio.run_coroutine_threadsafe(self._track(job, make_coro(job.reporter)), self.loop)
+        return job.id
+
+    async def _track(self, job, coro):
+        job.cancel_event = asyncio.Event()
+        if job.reporter.cancel_requested:
+            job.cancel_event.set()
+        # Every RPC the fetch makes, in any task it starts, is aborted once the event is set.
+        set_cancel_event(job.cancel_event)
+        try:
+            job.result = await coro
+            job.status = "cancelled" if job.reporter.cancel_requested else "done"
+        except Exception as e:
+            job.error = e
+            job.status = "failed"
+        finally:
+            job.finished = time.time()
+            self.loop.call_later(JOB_TTL, self._forget, job.id)
+
+    def _forget(self, job_id):
+        with self._lock:
+            self.jobs.pop(job_id, None)
+
+    def run_in_background(self, func, *args):
+        """Runs the blocking `func(*args)`, e.g. building an export file, on a worker thread and returns its Future."""
+        return self.executor.submit(func, *args)
+
+    def get(self, job_id):
+        """Returns the job, or None once it has been dropped (JOB_TTL seconds after it finished)."""
+        return self.jobs.get(job_id)
+
+    def release(self, job_id):
+        """Drops a finished job's result once its session has taken it; the job's log stays until JOB_TTL."""
+        job = self.jobs.get(job_id)
+        if job is not None and not job.running:
+            job.result = None
+
+    def cancel(self, job_id):
+        """
+        Stops a running job. Requests already in flight are aborted at once and
+        the fetchers return the rows collected so far as the job's result. The
+        task itself is never cancelled: that would lose those rows, and every
+        wait a fetch makes on Telegram already ends on the cancel event.
+        """
+        job = self.jobs.get(job_id)
+        if job is not None and job.running:
+            job.reporter.cancel_requested = True
+            self.loop.call_soon_threadsafe(self._abort, job)
+
+    def _abort(self, job):
+        if job.cancel_event is not None:
+            job.cancel_event.set()
+
+_default_runner = None
+_default_runner_lock = threading.Lock()
+
+def get_job_runner():
+    """Returns the process-wide JobRunner shared by all browser sessions."""
+    global _default_runner
+    with _default_runner_lock:
+        if _default_runner is None:
+            _default_runner = JobRunner()
+        return _default_runner
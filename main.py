@@ -1,27 +1,127 @@
 import streamlit as st
-import asyncio
 import pandas as pd
 import io
-from telegram_client import create_client, delete_session_file
+from telegram_client import ClientPool, connect_pool, create_client, delete_session_file, save_user_session, user_session_key
 from fetch_channel import fetch_channel_data
 from fetch_forwards import fetch_forwards
 from fetch_messages import fetch_messages
-from fetch_participants import fetch_participants
+from fetch_participants import SEARCH_PREFIXES, fetch_participants
+from fetch_combined import fetch_combined
+from jobs import get_job_runner
+from message_store import MessageStore
 from telethon.errors import PhoneNumberInvalidError, PhoneCodeInvalidError, SessionPasswordNeededError
-import nest_asyncio
 import re
 
-nest_asyncio.apply()
+# --- Background Jobs ---
+# Fetches run on the job runner's event loop, so the page stays usable while they do.
+runner = get_job_runner()
+if "job_ids" not in st.session_state:
+    st.session_state.job_ids = []
+    st.session_state.applied_jobs = set()
+
+# --- Derived Frames ---
+# Bumped whenever the fetched results change; frames derived from them are cached per version.
+if "result_version" not in st.session_state:
+    st.session_state.result_version = 0
+    st.session_state.derived = {}
+
+def derived_cache():
+    """Returns the cache of frames and files derived from the current results, emptied when they change."""
+    if st.session_state.derived.get("version") != st.session_state.result_version:
+        st.session_state.derived = {"version": st.session_state.result_version}
+    return st.session_state.derived
+
+def derived(name, build):
+    """Returns build() for the current result version, computing it at most once per fetch result."""
+    cache = derived_cache()
+    if name not in cache:
+        cache[name] = build()
+    return cache[name]
+
+# --- Exports ---
+def to_csv_bytes(df):
+    output = io.BytesIO()
+    df.to_csv(output, index=False)
+    return output.getvalue()
+
+def to_excel_bytes(sheets):
+    """Builds an .xlsx file with one sheet per (sheet name, DataFrame) in `sheets`."""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        for sheet_name, df in sheets:
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+    return output.getvalue()
+
+def convert_df_to_markdown(df):
+    return df.to_markdown(index=False, tablefmt="github")
+
+def export_button(key, label, file_name, mime, build):
+    """
+    Offers `file_name` for download without building it on every rerun. The
+    file is built by `build()` on a worker thread once the user asks for it,
+    and kept until the results change. `build` runs off the script thread, so
+    it must not touch st.session_state.
+    """
+    cache_key = f"export {file_name}"
 
-# --- Ensure an Event Loop Exists ---
-import sys
-if "event_loop" not in st.session_state:
-    if sys.platform == "win32":
-        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())  # Windows fix
-    st.session_state.event_loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(st.session_state.event_loop)
-else:
-    asyncio.set_event_loop(st.session_state.event_loop)  # Keep the same event loop
+    def show():
+        future = derived_cache().get(cache_key)
+        if future is None:
+            if st.button(f"⚙️ Prepare {file_name}", key=f"prepare_{key}"):
+                derived_cache()[cache_key] = runner.run_in_background(build)
+                st.rerun()
+        elif not future.done():
+            st.info(f"⏳ Preparing {file_name}...")
+        elif pending:
+            # It has just finished; redraw the page once so the polling stops.
+            st.rerun()
+        elif future.exception() is not None:
+            st.error(f"Could not build {file_name}: {future.exception()}")
+            if st.button("Try again", key=f"retry_{key}"):
+                del derived_cache()[cache_key]
+                st.rerun()
+        else:
+            st.download_button(label, data=future.result(), file_name=file_name, mime=mime, key=f"download_{key}")
+
+    # Poll once a second while the file is being built.
+    future = derived_cache().get(cache_key)
+    pending = future is not None and not future.done()
+    st.fragment(run_every=1 if pending else None)(show)()
+
+# Known user info columns; any other participants column is a group membership flag.
+USER_COLS = [
+    "User ID", "Deleted", "Is Bot", "Verified", "Restricted", "Scam", "Fake",
+    "Premium", "Access Hash", "First Name", "Last Name", "Username", "Phone",
+    "Status", "Timezone Info", "Restriction Reason", "Language Code", "Last Seen",
+    "Profile Picture DC ID", "Profile Picture Photo ID"
+]
+
+def aggregate_participants(df_participants):
+    """Aggregates participant rows to one row per user, with Group Count and Groups columns."""
+    group_cols = [col for col in df_participants.columns if col not in USER_COLS]
+
+    # Group by "User ID": for user info take the first value; for group flags, take max.
+    aggregated = df_participants.groupby("User ID").agg({
+        "Username": "first",
+        "First Name": "first",
+        "Last Name": "first",
+        "Status": "first",
+        **{col: "max" for col in group_cols}
+    }).reset_index()
+
+    # Convert group membership columns to numeric (if they aren't already)
+    if group_cols:
+        aggregated[group_cols] = aggregated[group_cols].fillna(0).apply(pd.to_numeric, errors='coerce').fillna(0).astype(int)
+        # Calculate the number of groups for each user.
+        aggregated["Group Count"] = aggregated[group_cols].sum(axis=1)
+        # Build a comma‑separated list of groups for each user.
+        aggregated["Groups"] = aggregated[group_cols].apply(
+            lambda row: ", ".join([col for col in group_cols if row[col] == 1]), axis=1
+        )
+    else:
+        aggregated["Group Count"] = 0
+        aggregated["Groups"] = ""
+    return aggregated
 
 def clean_column_name(name):
     name = str(name)
@@ -40,6 +140,8 @@ if "auth_step" not in st.session_state:
     st.session_state.auth_step = 1
     st.session_state.authenticated = False
     st.session_state.client = None
+# Sets this browser's session cookie on every run until the browser has it (see user_session_key).
+user_session_key()
 
 # --- Step 1: Enter API Credentials ---
 if st.session_state.auth_step == 1:
@@ -62,14 +164,23 @@ if st.session_state.auth_step == 1:
                     if st.session_state.client is None:
                         st.session_state.client = create_client(int(api_id), api_hash)
 
+                    session_key = user_session_key()
+
                     async def connect_and_send_code():
                         await st.session_state.client.connect()
-                        if not await st.session_state.client.is_user_authorized():
-                            await st.session_state.client.send_code_request(phone_number)
+                        save_user_session(st.session_state.client, session_key)
+                        if await st.session_state.client.is_user_authorized():
+                            return True
+                        await st.session_state.client.send_code_request(phone_number)
+                        return False
 
                     st.write("Connecting with Telegram's API...")
-                    st.session_state.event_loop.run_until_complete(connect_and_send_code())
-                    st.session_state.auth_step = 2  
+                    if runner.run(connect_and_send_code()):
+                        # This browser session already signed in before; no code needed.
+                        st.session_state.authenticated = True
+                        st.session_state.auth_step = 3
+                    else:
+                        st.session_state.auth_step = 2
                     st.rerun()
 
                 except PhoneNumberInvalidError:
@@ -94,7 +205,8 @@ elif st.session_state.auth_step == 2:
                 async def sign_in():
                     await st.session_state.client.sign_in(st.session_state.phone_number, verification_code)
 
-                st.session_state.event_loop.run_until_complete(sign_in())  # ✅ Ensure same event loop is used
+                runner.run(sign_in())  # ✅ Ensure same event loop is used
+                save_user_session(st.session_state.client, user_session_key())
                 st.session_state.auth_step = 3  
                 st.session_state.authenticated = True
                 st.success("Authentication successful!")
@@ -116,7 +228,7 @@ elif st.session_state.auth_step == 3 and st.session_state.authenticated:
     st.subheader("Fetch Telegram Channel Data")
 
     # Choose what to fetch
-    fetch_option = st.radio("Select Data to Fetch:", ["Channel Info", "Messages", "Forwards", "Participants"])
+    fetch_option = st.radio("Select Data to Fetch:", ["Channel Info", "Messages", "Forwards", "Participants", "Messages + Forwards + Participants"])
 
     # Channel usernames input
     channel_input = st.text_area("Enter Telegram channel usernames (comma-separated):", "")
@@ -125,76 +237,179 @@ elif st.session_state.auth_step == 3 and st.session_state.authenticated:
     participant_method = "Default"
     start_date = end_date = None
     include_comments = True  # Default to including comments
-    if fetch_option in ["Messages", "Forwards", "Participants"]:
-        if fetch_option == "Messages":
+    channel_concurrency = 1
+    reply_concurrency = 5
+    use_store = False
+    participant_sink = "memory"
+    extra_sessions = ""
+    search_concurrency = 4
+    search_prefixes = SEARCH_PREFIXES
+    start_over = False
+    if fetch_option in ["Messages", "Forwards", "Participants", "Messages + Forwards + Participants"]:
+        if fetch_option in ["Messages", "Messages + Forwards + Participants"]:
             msg_mode = st.radio("Message Mode", [
                 "Original posts only", 
                 "Original posts + comments (may take significantly longer to load)"
             ])
             include_comments = "comments" in msg_mode.lower()
+            channel_concurrency = st.number_input("Channels to crawl in parallel", min_value=1, max_value=10, value=1, step=1)
+            if include_comments:
+                reply_concurrency = st.number_input("Comment threads to fetch in parallel", min_value=1, max_value=20, value=5, step=1)
+            if fetch_option == "Messages":
+                extra_sessions = st.text_input("Optional: extra authorized sessions to crawl with (comma-separated session names)", "")
+                use_store = st.checkbox("Use local message store (only fetch messages newer than the last sync)", value=False)
+                start_over = st.checkbox("Start over (discard saved progress from an interrupted fetch of these channels)", value=False)
         if fetch_option == "Participants":
-            participant_method = st.radio("Select Participant Fetch Method:", ["Default", "Via Messages"])
+            participant_method = st.radio("Select Participant Fetch Method:", ["Default", "Search Partitions", "Via Messages"])
+            if participant_method == "Search Partitions":
+                search_concurrency = st.number_input("Search partitions to fetch in parallel", min_value=1, max_value=10, value=4, step=1)
+                search_prefixes = st.text_input("Characters to search by (add the alphabet of non-Latin groups, e.g. Cyrillic or Arabic letters)", SEARCH_PREFIXES)
+            if participant_method in ["Default", "Search Partitions"]:
+                sink_labels = {"Memory": "memory", "CSV file (tgforge_participants/)": "csv", "SQLite database (tgforge_participants.db)": "sqlite"}
+                participant_sink = sink_labels[st.radio("Stream participants to:", list(sink_labels))]
         use_date_range = st.checkbox("Optional: Filter by Date Range", value=False)
         if use_date_range:
             start_date = st.date_input("Start Date")
             end_date = st.date_input("End Date")
     else:
         start_date = end_date = None
+        channel_concurrency = st.number_input("Channels to look up in parallel", min_value=1, max_value=20, value=5, step=1)
+
+    # Fetch buttons for each option; each one submits a background job.
+    client = st.session_state.client
+    channel_list = channel_input.split(",")
+    job_label = f"{fetch_option}: {channel_input.strip()[:60]}"
+
+    def submit_job(kind, make_coro):
+        st.session_state.job_ids.append(runner.submit(kind, job_label, make_coro))
 
-    # Fetch buttons for each option
     if fetch_option == "Channel Info":
         if st.button("Fetch Channel Info"):
-            st.session_state.channel_data = st.session_state.event_loop.run_until_complete(
-                fetch_channel_data(st.session_state.client, channel_input.split(","))
-            )
+            concurrency = int(channel_concurrency)
+            submit_job("channel_info", lambda reporter: fetch_channel_data(client, channel_list, concurrency=concurrency, reporter=reporter))
     elif fetch_option == "Messages":
         if st.button("Fetch Messages"):
-            st.session_state.messages_data, st.session_state.top_hashtags, st.session_state.top_urls, \
-            st.session_state.top_domains, st.session_state.forward_counts, st.session_state.daily_volume, \
-            st.session_state.weekly_volume, st.session_state.monthly_volume = \
-                st.session_state.event_loop.run_until_complete(
-                    fetch_messages(st.session_state.client, channel_input.split(","), start_date, end_date, include_comments=include_comments)
-                )
+            api_id, api_hash = int(st.session_state.api_id), st.session_state.api_hash
+            sessions = [s.strip() for s in extra_sessions.split(",") if s.strip()]
+            store = MessageStore() if use_store else None
+            concurrency, replies = int(channel_concurrency), int(reply_concurrency)
+
+            async def crawl_messages(reporter):
+                crawler = client
+                if sessions:
+                    # Spread the channels over several accounts, each with its own rate limits. The extra
+                    # accounts' clients are shared by every job and stay connected, like the signed-in one.
+                    crawler, skipped = await connect_pool(api_id, api_hash, client, sessions)
+                    if skipped:
+                        reporter.error(f"Skipping sessions that are not authorized: {', '.join(skipped)}")
+                result = await fetch_messages(crawler, channel_list, start_date, end_date, include_comments=include_comments, concurrency=concurrency,
+                                              reply_concurrency=replies, store=store, reporter=reporter, resume=not start_over)
+                return result, crawler.throughput() if isinstance(crawler, ClientPool) else None
+
+            submit_job("messages", crawl_messages)
+    elif fetch_option == "Messages + Forwards + Participants":
+        if st.button("Fetch All (Single Pass)"):
+            concurrency, replies = int(channel_concurrency), int(reply_concurrency)
+            submit_job("combined", lambda reporter: fetch_combined(client, channel_list, start_date, end_date, include_comments=include_comments,
+                                                                   concurrency=concurrency, reply_concurrency=replies, reporter=reporter))
     elif fetch_option == "Forwards":
         if st.button("Fetch Forwards"):
-            st.session_state.forwards_data, st.session_state.forward_counts = \
-                st.session_state.event_loop.run_until_complete(
-                    fetch_forwards(st.session_state.client, channel_input.split(","), start_date, end_date)
-                )
+            submit_job("forwards", lambda reporter: fetch_forwards(client, channel_list, start_date, end_date, reporter=reporter))
     elif fetch_option == "Participants":
         if st.button("Fetch Participants"):
             groups = [g.strip() for g in channel_input.split(",") if g.strip()]
             if not groups:
                 st.error("Please enter at least one valid group name.")
+            elif participant_method == "Default":
+                submit_job("participants", lambda reporter: fetch_participants(client, groups, method="default", sink=participant_sink, reporter=reporter))
+            elif participant_method == "Search Partitions":
+                partitions = int(search_concurrency)
+                submit_job("participants", lambda reporter: fetch_participants(client, groups, method="search", sink=participant_sink,
+                                                                               search_concurrency=partitions, search_prefixes=search_prefixes, reporter=reporter))
             else:
-                if participant_method == "Default":
-                    (st.session_state.participants_data, 
-                     st.session_state.participants_reported,
-                     st.session_state.participants_fetched,
-                     st.session_state.participants_group_counts) = st.session_state.event_loop.run_until_complete(
-                        fetch_participants(st.session_state.client, groups, method="default")
-                    )
-                else:
-                    (st.session_state.participants_data, 
-                     st.session_state.participants_reported,
-                     st.session_state.participants_fetched,
-                     st.session_state.participants_group_counts) = st.session_state.event_loop.run_until_complete(
-                        fetch_participants(st.session_state.client, groups, method="messages", start_date=start_date, end_date=end_date)
-                    )
-    
+                submit_job("participants", lambda reporter: fetch_participants(client, groups, method="messages", start_date=start_date,
+                                                                               end_date=end_date, reporter=reporter))
+
+    # Copy a finished job's result into the keys the result views below read.
+    def apply_messages_result(result):
+        st.session_state.messages_data, st.session_state.top_hashtags, st.session_state.top_urls, \
+        st.session_state.top_domains, st.session_state.forward_counts, st.session_state.daily_volume, \
+        st.session_state.weekly_volume, st.session_state.monthly_volume, st.session_state.hourly_volume = result
+
+    def apply_participants_result(result):
+        (st.session_state.participants_data,
+         st.session_state.participants_reported,
+         st.session_state.participants_fetched,
+         st.session_state.participants_group_counts) = result
+
+    def apply_job_result(job):
+        st.session_state.result_version += 1
+        if job.kind == "channel_info":
+            st.session_state.channel_data = job.result
+        elif job.kind == "messages":
+            messages_result, throughput = job.result
+            apply_messages_result(messages_result)
+            if throughput is not None:
+                st.session_state.account_throughput = throughput
+        elif job.kind == "forwards":
+            st.session_state.forwards_data, st.session_state.forward_counts = job.result
+        elif job.kind == "participants":
+            apply_participants_result(job.result)
+        elif job.kind == "combined":
+            messages_result, forwards_result, participants_result = job.result
+            apply_messages_result(messages_result)
+            st.session_state.forwards_data = forwards_result[0]
+            apply_participants_result(participants_result)
+
+    def show_jobs():
+        # The runner drops finished jobs after a while; forget those here too.
+        st.session_state.job_ids = [job_id for job_id in st.session_state.job_ids if runner.get(job_id) is not None]
+        st.session_state.applied_jobs &= set(st.session_state.job_ids)
+        jobs = [job for job in map(runner.get, reversed(st.session_state.job_ids)) if job is not None]
+        finished = [job for job in jobs if not job.running and job.id not in st.session_state.applied_jobs]
+        if finished:
+            # Show each job's result once, as soon as it is done, then release it and redraw the whole page.
+            for job in reversed(finished):
+                st.session_state.applied_jobs.add(job.id)
+                if job.result is not None:
+                    apply_job_result(job)
+                runner.release(job.id)
+            st.rerun()
+
+        if jobs:
+            st.write("### Jobs")
+        for job in jobs:
+            state = {"running": "running", "done": "complete"}.get(job.status, "error")
+            status = "cancelling" if job.running and job.reporter.cancel_requested else job.status
+            with st.status(f"#{job.id} {job.label} ({status}, {job.elapsed():.0f}s)", state=state, expanded=job.running):
+                for text, is_error in job.reporter.lines()[-10:]:
+                    (st.error if is_error else st.write)(text)
+                if job.error is not None:
+                    st.error(f"Error: {job.error}")
+                if job.reporter.row_count():
+                    st.write(f"{job.reporter.row_count()} rows collected so far.")
+                    if job.running:
+                        st.dataframe(pd.DataFrame(job.reporter.rows(last=25)).astype(str), hide_index=True)  # partial rows can mix types
+                if job.running and st.button("Cancel", key=f"cancel_job_{job.id}"):
+                    runner.cancel(job.id)
+
+    # Poll once a second while any of this session's jobs is running.
+    polling = any(job is not None and job.running for job in map(runner.get, st.session_state.job_ids))
+    st.fragment(run_every=1 if polling else None)(show_jobs)()
+
     # --- Refresh Button (Clears Display But Keeps Data) ---
     if st.button("🔄 Refresh / Cancel"):
-        # Signal cancellation to any running fetch tasks
-        st.session_state.cancel_fetch = True
+        # Signal cancellation to this session's running jobs
+        for job_id in st.session_state.job_ids:
+            runner.cancel(job_id)
         # Clear all keys—including those for participants—in session state
         for key in ["channel_data", "forwards_data", "messages_data", "top_hashtags",
                     "top_urls", "top_domains", "forward_counts", "daily_volume",
-                    "weekly_volume", "monthly_volume", "participants_data",
-                    "participants_reported", "participants_fetched", "participants_group_counts"]:
+                    "weekly_volume", "monthly_volume", "hourly_volume", "participants_data",
+                    "participants_reported", "participants_fetched", "participants_group_counts", "account_throughput"]:
             if key in st.session_state:
                 del st.session_state[key]
-        # Clear the cancellation flag for the next run
-        st.session_state.cancel_fetch = False
+        st.session_state.result_version += 1
         st.rerun()
 
     # ✅ Restore original printing format for channel info
@@ -210,27 +425,22 @@ elif st.session_state.auth_step == 3 and st.session_state.authenticated:
 
     # ✅ Show first 25 rows of forwards data in a table
     if "forwards_data" in st.session_state and st.session_state.forwards_data is not None:
-        df_fwd = pd.DataFrame(st.session_state.forwards_data)
+        df_fwd = derived("forwards", lambda: pd.DataFrame(st.session_state.forwards_data))
         st.write("### Forwarded Messages Preview (First 25 Rows)")
         st.dataframe(df_fwd.head(25))
 
-        # ✅ Fix CSV Download (use BytesIO)
-        csv_output = io.BytesIO()
-        df_fwd.to_csv(csv_output, index=False)
-        csv_output.seek(0)
-        st.download_button(
-            "📥 Download Forwards (CSV)",
-            data=csv_output.getvalue(),
-            file_name="forwards.csv",
-            mime="text/csv",
-        )
+        export_button("forwards_preview_csv", "📥 Download Forwards (CSV)", "forwards.csv", "text/csv", lambda: to_csv_bytes(df_fwd))
+
+    if "account_throughput" in st.session_state:
+        st.write("### Per-Account Throughput")
+        st.dataframe(pd.DataFrame(st.session_state.account_throughput), hide_index=True)
 
     # ✅ Show top 25 most viewed posts
     if "messages_data" in st.session_state:
-        df_messages = pd.DataFrame(st.session_state.messages_data)
+        df_messages = derived("messages", lambda: pd.DataFrame(st.session_state.messages_data))
 
         if "Views" in df_messages.columns:
-            df_top_views = df_messages.sort_values(by="Views", ascending=False).head(25)
+            df_top_views = derived("top_25_viewed", lambda: df_messages.sort_values(by="Views", ascending=False).head(25))
             st.write("### Top 25 Most Viewed Posts")
             st.data_editor(
                 df_top_views,
@@ -282,154 +492,96 @@ elif st.session_state.auth_step == 3 and st.session_state.authenticated:
         st.write("### Top Hashtags")
         st.data_editor(df_hashtags.head(25))
     
-    if "participants_data" in st.session_state and not pd.DataFrame(st.session_state.participants_data).empty:
+    df_participants = derived("participants", lambda: pd.DataFrame(st.session_state.get("participants_data")))
+    if not df_participants.empty:
         st.write("### Participants (Aggregated by User)")
-        df_participants = pd.DataFrame(st.session_state.participants_data)
-
-        # Explicitly define known user info columns.
-        user_cols = [
-            "User ID", "Deleted", "Is Bot", "Verified", "Restricted", "Scam", "Fake", 
-            "Premium", "Access Hash", "First Name", "Last Name", "Username", "Phone", 
-            "Status", "Timezone Info", "Restriction Reason", "Language Code", "Last Seen", 
-            "Profile Picture DC ID", "Profile Picture Photo ID"
-        ]
-        # Assume that any column not in user_cols is a group membership flag.
-        group_cols = [col for col in df_participants.columns if col not in user_cols]
-
-        # Group by "User ID": for user info take the first value; for group flags, take max.
-        aggregated = df_participants.groupby("User ID").agg({
-            "Username": "first",
-            "First Name": "first",
-            "Last Name": "first",
-            "Status": "first",
-            **{col: "max" for col in group_cols}
-        }).reset_index()
-
-        # Convert group membership columns to numeric (if they aren't already)
-        if group_cols:
-            aggregated[group_cols] = aggregated[group_cols].fillna(0).apply(pd.to_numeric, errors='coerce').fillna(0).astype(int)
-            # Calculate the number of groups for each user.
-            aggregated["Group Count"] = aggregated[group_cols].sum(axis=1)
-            # Build a comma‑separated list of groups for each user.
-            aggregated["Groups"] = aggregated[group_cols].apply(
-                lambda row: ", ".join([col for col in group_cols if row[col] == 1]), axis=1
-            )
-        else:
-            aggregated["Group Count"] = 0
-            aggregated["Groups"] = ""
+        aggregated = derived("participants_aggregated", lambda: aggregate_participants(df_participants))
 
         # Create two tabs: one with all aggregated participants and one for those in 2 or more groups.
         tabs = st.tabs(["All Participants", "Active in ≥ 2 Chats"])
         with tabs[0]:
             st.dataframe(aggregated)
         with tabs[1]:
-            multi = aggregated[aggregated["Group Count"] >= 2]
-            st.dataframe(multi[["User ID", "Username", "Group Count", "Groups"]])
+            multi = derived("participants_multi", lambda: aggregated[aggregated["Group Count"] >= 2][["User ID", "Username", "Group Count", "Groups"]])
+            st.dataframe(multi)
 
         if "participants_group_counts" in st.session_state:
             st.write("#### Participant Count Comparison:")
             for group, counts in st.session_state.participants_group_counts.items():
-                st.write(f"{group}: {counts[0]} (reported by channel info) | {counts[1]} collected")
+                coverage = f" ({counts[1] / counts[0]:.1%} coverage)" if isinstance(counts[0], int) and counts[0] > 0 else ""
+                st.write(f"{group}: {counts[0]} (reported by channel info) | {counts[1]} collected{coverage}")
         # Optionally, write a summary below the tabs
         st.write("Total unique participants collected:", len(aggregated))
 
     # ✅ Define color palette
     COLOR_PALETTE = ["#C7074D", "#B4B2B1", "#4C4193", "#0068B2", "#E76863", "#5C6771"]
 
-    def convert_df_to_markdown(df):
-        return df.to_markdown(index=False, tablefmt="github")
-
-    def plot_vot_chart(df, index_col, title, freq="D"):
+    def plot_vot_chart(df, index_col, title):
+        # Volume frames come from the rollup engine already gap-free, so they are plotted as-is.
         st.subheader(title)
     
         if df.empty:
             st.warning("No data available.")
             return
     
-        df[index_col] = pd.to_datetime(df[index_col], errors="coerce")
-        df = df.set_index(index_col)
-    
-        full_range = pd.date_range(start=df.index.min(), end=df.index.max(), freq=freq)
-        df = df.reindex(full_range, fill_value=0)
-        df.index.name = index_col
-        df.reset_index(inplace=True)
-    
         show_total = st.toggle(f"Show aggregated total for {title}", value=False)
     
         if show_total:
-            df["Total"] = df.select_dtypes(include=["number"]).iloc[:, 1:].sum(axis=1)
-            df = df[[index_col, "Total"]]
             colors = ["#C7074D"]
         else:
             num_lines = df.shape[1] - 1
             colors = COLOR_PALETTE[:num_lines] if num_lines <= len(COLOR_PALETTE) else None
-    
-        df_plot = df.set_index(index_col)
-        df_plot = df_plot.select_dtypes(include=["number"])
-        df_plot.columns = [clean_column_name(c) for c in df_plot.columns]
-    
+
+        def build_plot_frame(df):
+            if show_total:
+                df = df.assign(Total=df.select_dtypes(include=["number"]).iloc[:, 1:].sum(axis=1))
+                df = df[[index_col, "Total"]]
+            df_plot = df.set_index(index_col)
+            df_plot = df_plot.select_dtypes(include=["number"])
+            df_plot.columns = [clean_column_name(c) for c in df_plot.columns]
+            return df_plot
+
+        # Flipping the toggle reuses the frame built for that state of this result.
+        df_plot = derived(f"plot {title} {show_total}", lambda: build_plot_frame(df))
         st.line_chart(df_plot, color=colors)
 
-    # ✅ Show Volume Over Time Charts with Missing Dates Filled
+    # ✅ Show Volume Over Time Charts
+    # The hourly frame is only built for short spans, and even then is charted on request.
+    if st.session_state.get("hourly_volume") is not None and st.checkbox("Show hourly message volume", value=False):
+        plot_vot_chart(st.session_state.hourly_volume, "Hour", "Hourly Message Volume")
+
     if "daily_volume" in st.session_state:
-        df_daily = pd.DataFrame(st.session_state.daily_volume)
-        df_daily = df_daily.fillna(0)
-        plot_vot_chart(df_daily, "Date", "Daily Message Volume", freq="D")
+        plot_vot_chart(st.session_state.daily_volume, "Date", "Daily Message Volume")
 
     if "weekly_volume" in st.session_state:
-        df_weekly = pd.DataFrame(st.session_state.weekly_volume)
-        df_weekly = df_weekly.fillna(0)
-        plot_vot_chart(df_weekly, "Week", "Weekly Message Volume", freq="W-TUE")
+        plot_vot_chart(st.session_state.weekly_volume, "Week", "Weekly Message Volume")
 
     if "monthly_volume" in st.session_state:
-        df_monthly = pd.DataFrame(st.session_state.monthly_volume)
-        df_monthly = df_monthly.fillna(0)
-        plot_vot_chart(df_monthly, "Year-Month", "Monthly Message Volume", freq="MS")
+        plot_vot_chart(st.session_state.monthly_volume, "Year-Month", "Monthly Message Volume")
      
     # CSV Download
     if "messages_data" in st.session_state and st.session_state.messages_data is not None:
-        df_messages = pd.DataFrame(st.session_state.messages_data)
+        df_messages = derived("messages", lambda: pd.DataFrame(st.session_state.messages_data))
     
         st.subheader("Export Raw Data")
         format_option = st.selectbox("Choose export format for raw Telegram data:", ["CSV", "Markdown", "Excel"], key="messages_export_format")
     
         if format_option == "CSV":
-            csv_output = io.BytesIO()
-            df_messages.to_csv(csv_output, index=False)
-            csv_output.seek(0)
-            st.download_button(
-                "📥 Download as CSV",
-                data=csv_output.getvalue(),
-                file_name="messages.csv",
-                mime="text/csv",
-            )
+            export_button("messages_csv", "📥 Download as CSV", "messages.csv", "text/csv", lambda: to_csv_bytes(df_messages))
     
         elif format_option == "Markdown":
-            markdown_output = convert_df_to_markdown(df_messages.head(1000))  # Limit size if needed
-            st.download_button(
-                "📥 Download as Markdown",
-                data=markdown_output,
-                file_name="messages.md",
-                mime="text/markdown",
-            )
+            export_button("messages_md", "📥 Download as Markdown", "messages.md", "text/markdown",
+                          lambda: convert_df_to_markdown(df_messages.head(1000)))  # Limit size if needed
     
         elif format_option == "Excel":
-            output_xlsx = io.BytesIO()
-            with pd.ExcelWriter(output_xlsx, engine="openpyxl") as writer:
-                df_messages.to_excel(writer, sheet_name="Messages", index=False)
-            output_xlsx.seek(0)
-            st.download_button(
-                "📥 Download as Excel",
-                data=output_xlsx.getvalue(),
-                file_name="messages.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            )
+            export_button("messages_xlsx", "📥 Download as Excel", "messages.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                          lambda: to_excel_bytes([("Messages", df_messages)]))
     
     # XLSX Download
     if "messages_data" in st.session_state and st.session_state.messages_data is not None:
         st.subheader("Export Channel(s) Analytics")
         # Build XLSX for message analytics
-        df_messages = pd.DataFrame(st.session_state.messages_data).nlargest(50, "Views")  # Top 50 most viewed messages
+        df_top_viewed = derived("top_50_viewed", lambda: df_messages.nlargest(50, "Views") if "Views" in df_messages.columns else df_messages)  # Top 50 most viewed messages
         df_top_domains = pd.DataFrame(st.session_state.top_domains).head(25)               # Top 25 shared domains
         df_top_urls = pd.DataFrame(st.session_state.top_urls).head(25)                     # Top 25 shared URLs
         df_forward_counts = pd.DataFrame(st.session_state.forward_counts)                # Forward counts
@@ -438,129 +590,54 @@ elif st.session_state.auth_step == 3 and st.session_state.authenticated:
         df_weekly_volume = pd.DataFrame(st.session_state.weekly_volume)                  # Weekly volume
         df_monthly_volume = pd.DataFrame(st.session_state.monthly_volume)                # Monthly volume
 
-        output_xlsx = io.BytesIO()
-        with pd.ExcelWriter(output_xlsx, engine="openpyxl") as writer:
-            df_messages.to_excel(writer, sheet_name="Top 50 Viewed Posts", index=False)
-            df_top_domains.to_excel(writer, sheet_name="Top 25 Shared Domains", index=False)
-            df_top_urls.to_excel(writer, sheet_name="Top 25 Shared URLs", index=False)
-            df_forward_counts.to_excel(writer, sheet_name="Forward Counts", index=False)
-            df_top_hashtags.to_excel(writer, sheet_name="Top 25 Hashtags", index=False)
-            df_daily_volume.to_excel(writer, sheet_name="Daily Volume", index=False)
-            df_weekly_volume.to_excel(writer, sheet_name="Weekly Volume", index=False)
-            df_monthly_volume.to_excel(writer, sheet_name="Monthly Volume", index=False)
-        output_xlsx.seek(0)
-
-        st.download_button(
-            "📥 Download Analytics",
-            data=output_xlsx.getvalue(),
-            file_name="messages_analysis.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        )
+        export_button("analytics_xlsx", "📥 Download Analytics", "messages_analysis.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                      lambda: to_excel_bytes([
+                          ("Top 50 Viewed Posts", df_top_viewed),
+                          ("Top 25 Shared Domains", df_top_domains),
+                          ("Top 25 Shared URLs", df_top_urls),
+                          ("Forward Counts", df_forward_counts),
+                          ("Top 25 Hashtags", df_top_hashtags),
+                          ("Daily Volume", df_daily_volume),
+                          ("Weekly Volume", df_weekly_volume),
+                          ("Monthly Volume", df_monthly_volume),
+                      ]))
 
     elif "forwards_data" in st.session_state and st.session_state.forwards_data is not None:
         st.subheader("Export Channel(s) Analytics")
-        df_forwards = pd.DataFrame(st.session_state.forwards_data)
+        df_forwards = derived("forwards", lambda: pd.DataFrame(st.session_state.forwards_data))
         df_forward_counts = pd.DataFrame(st.session_state.forward_counts)
     
         st.subheader("📤 Export Forwards Data")
         format_option = st.selectbox("Choose export format:", ["CSV", "Markdown", "Excel"], key="forwards_export_format")
     
         if format_option == "CSV":
-            csv_output = io.BytesIO()
-            df_forwards.to_csv(csv_output, index=False)
-            csv_output.seek(0)
-            st.download_button(
-                "📥 Download as CSV",
-                data=csv_output.getvalue(),
-                file_name="forwards.csv",
-                mime="text/csv",
-            )
+            export_button("forwards_csv", "📥 Download as CSV", "forwards.csv", "text/csv", lambda: to_csv_bytes(df_forwards))
     
         elif format_option == "Markdown":
-            markdown_output = convert_df_to_markdown(df_forwards.head(1000))
-            st.download_button(
-                "📥 Download as Markdown",
-                data=markdown_output,
-                file_name="forwards.md",
-                mime="text/markdown",
-            )
+            export_button("forwards_md", "📥 Download as Markdown", "forwards.md", "text/markdown",
+                          lambda: convert_df_to_markdown(df_forwards.head(1000)))
     
         elif format_option == "Excel":
-            output_xlsx = io.BytesIO()
-            with pd.ExcelWriter(output_xlsx, engine="openpyxl") as writer:
-                df_forwards.to_excel(writer, sheet_name="Forwarded Messages", index=False)
-                df_forward_counts.to_excel(writer, sheet_name="Forward Counts", index=False)
-            output_xlsx.seek(0)
-            st.download_button(
-                "📥 Download as Excel",
-                data=output_xlsx.getvalue(),
-                file_name="forwards_analysis.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            )
+            export_button("forwards_xlsx", "📥 Download as Excel", "forwards_analysis.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                          lambda: to_excel_bytes([("Forwarded Messages", df_forwards), ("Forward Counts", df_forward_counts)]))
 
-    elif "participants_data" in st.session_state and not pd.DataFrame(st.session_state.participants_data).empty:
+    elif not df_participants.empty:
         st.subheader("Export Channel(s) Analytics")
-        df_participants = pd.DataFrame(st.session_state.participants_data)
-    
-        user_cols = [
-            "User ID", "Deleted", "Is Bot", "Verified", "Restricted", "Scam", "Fake", 
-            "Premium", "Access Hash", "First Name", "Last Name", "Username", "Phone", 
-            "Status", "Timezone Info", "Restriction Reason", "Language Code", "Last Seen", 
-            "Profile Picture DC ID", "Profile Picture Photo ID"
-        ]
-        group_cols = [col for col in df_participants.columns if col not in user_cols]
-        aggregated = df_participants.groupby("User ID").agg({
-            "Username": "first",
-            "First Name": "first",
-            "Last Name": "first",
-            "Status": "first",
-            **{col: "max" for col in group_cols}
-        }).reset_index()
-        if group_cols:
-            aggregated[group_cols] = aggregated[group_cols].fillna(0).apply(pd.to_numeric, errors='coerce').fillna(0).astype(int)
-            aggregated["Group Count"] = aggregated[group_cols].sum(axis=1)
-            aggregated["Groups"] = aggregated[group_cols].apply(
-                lambda row: ", ".join([col for col in group_cols if row[col] == 1]), axis=1
-            )
-        else:
-            aggregated["Group Count"] = 0
-            aggregated["Groups"] = ""
+        aggregated = derived("participants_aggregated", lambda: aggregate_participants(df_participants))
     
         st.subheader("📤 Export Participants Data")
         format_option = st.selectbox("Choose export format:", ["CSV", "Markdown", "Excel"], key="participants_export_format")
     
         if format_option == "CSV":
-            csv_output = io.BytesIO()
-            aggregated.to_csv(csv_output, index=False)
-            csv_output.seek(0)
-            st.download_button(
-                "📥 Download as CSV",
-                data=csv_output.getvalue(),
-                file_name="participants.csv",
-                mime="text/csv",
-            )
+            export_button("participants_csv", "📥 Download as CSV", "participants.csv", "text/csv", lambda: to_csv_bytes(aggregated))
     
         elif format_option == "Markdown":
-            markdown_output = convert_df_to_markdown(aggregated.head(1000))
-            st.download_button(
-                "📥 Download as Markdown",
-                data=markdown_output,
-                file_name="participants.md",
-                mime="text/markdown",
-            )
+            export_button("participants_md", "📥 Download as Markdown", "participants.md", "text/markdown",
+                          lambda: convert_df_to_markdown(aggregated.head(1000)))
     
         elif format_option == "Excel":
-            output_xlsx_participants = io.BytesIO()
-            with pd.ExcelWriter(output_xlsx_participants, engine="openpyxl") as writer:
-                df_participants.to_excel(writer, sheet_name="Raw Participants", index=False)
-                aggregated.to_excel(writer, sheet_name="Aggregated Participants", index=False)
-            output_xlsx_participants.seek(0)
-            st.download_button(
-                "📥 Download as Excel",
-                data=output_xlsx_participants.getvalue(),
-                file_name="participants_analysis.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+            export_button("participants_xlsx", "📥 Download as Excel", "participants_analysis.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                          lambda: to_excel_bytes([("Raw Participants", df_participants), ("Aggregated Participants", aggregated)]))
             
 st.markdown(
     """
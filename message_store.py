@@ -0,0 +1,131 @@
+import json
+import sqlite3
+from datetime import date, datetime
+
+# Define the local store file path
+STORE_PATH = "tgforge_messages.db"
+
+def _encode(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+class MessageStore:
+    """
+    Local SQLite copy of crawled message rows, keyed by (channel ID, message ID).
+
+    Replies share the key space with their parent's post ID in `parent_id`
+    (0 for posts), because comment IDs come from the linked discussion group and
+    can collide with post IDs. `sync_state` remembers, per channel, the highest
+    post ID known to be synced together with the oldest date the sync covers,
+    so later runs only need to fetch newer posts via `min_id`.
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    channel_id INTEGER NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    parent_id INTEGER NOT NULL DEFAULT 0,
+                    post_date TEXT,
+                    row TEXT NOT NULL,
+                    PRIMARY KEY (channel_id, message_id, parent_id)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    channel_id INTEGER PRIMARY KEY,
+                    channel TEXT,
+                    max_message_id INTEGER NOT NULL,
+                    synced_from TEXT,
+                    with_comments INTEGER NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def sync_state(self, channel_id):
+        """Returns (max_message_id, synced_from, with_comments) for a channel, or None if never synced."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT max_message_id, synced_from, with_comments FROM sync_state WHERE channel_id = ?",
+                (channel_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        max_message_id, synced_from, with_comments = row
+        return max_message_id, date.fromisoformat(synced_from) if synced_from else None, bool(with_comments)
+
+    def can_sync_incrementally(self, channel_id, start_date=None, include_comments=True):
+        """True if the stored history already covers everything up to the last synced post for this request."""
+        state = self.sync_state(channel_id)
+        if state is None:
+            return False
+        _, synced_from, with_comments = state
+        if include_comments and not with_comments:
+            return False
+        return synced_from is None or (start_date is not None and start_date >= synced_from)
+
+    def save_rows(self, channel_id, rows):
+        """Upserts message and reply rows for a channel."""
+        post_dates = {
+            row["Message ID"]: row["Message DateTime (UTC)"]
+            for row in rows if row["Parent Message ID"] is None
+        }
+        records = []
+        for row in rows:
+            parent_id = row["Parent Message ID"] or 0
+            post_date = post_dates.get(parent_id, row["Message DateTime (UTC)"]) if parent_id else row["Message DateTime (UTC)"]
+            records.append((
+                channel_id,
+                row["Message ID"],
+                parent_id,
+                post_date.isoformat() if isinstance(post_date, datetime) else None,
+                json.dumps(row, default=_encode),
+            ))
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?)", records)
+
+    def mark_synced(self, channel_id, channel_name, max_message_id, synced_from=None, with_comments=True):
+        """Records that every post from `synced_from` up to `max_message_id` is in the store."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    channel_id,
+                    channel_name,
+                    max_message_id,
+                    synced_from.isoformat() if synced_from else None,
+                    int(with_comments),
+                    datetime.utcnow().isoformat(),
+                ),
+            )
+
+    def load_rows(self, channel_id, channel_name, start_date=None, end_date=None, include_comments=True):
+        """
+        Returns stored rows for a channel in crawl order (newest post first, each
+        post preceded by its replies), filtered by the post's date.
+        """
+        query = "SELECT row FROM messages WHERE channel_id = ?"
+        params = [channel_id]
+        if start_date:
+            query += " AND substr(post_date, 1, 10) >= ?"
+            params.append(start_date.isoformat())
+        if end_date:
+            query += " AND substr(post_date, 1, 10) <= ?"
+            params.append(end_date.isoformat())
+        if not include_comments:
+            query += " AND parent_id = 0"
+        query += " ORDER BY CASE parent_id WHEN 0 THEN message_id ELSE parent_id END DESC, parent_id = 0, message_id DESC"
+
+        with self._connect() as conn:
+            rows = [json.loads(record) for (record,) in conn.execute(query, params)]
+        for row in rows:
+            row["Channel"] = channel_name
+            if row["Message DateTime (UTC)"] != "Not Available":
+                row["Message DateTime (UTC)"] = datetime.fromisoformat(row["Message DateTime (UTC)"])
+        return rows
@@ -0,0 +1,95 @@
+from progress import StreamlitReporter
+from rate_limiter import FetchCancelled, limiter_for
+from utils import end_date_offset
+
+class MessagePager:
+    """
+    The paging loop shared by every fetcher that walks a channel's history.
+
+    `pages()` requests 100 messages at a time, newest first, through the
+    client's rate limiter. That is Telegram's page size, so each request
+    costs one token and a flood wait repeats only that page. It jumps to
+    end_date on the first request and yields only the messages inside
+    start_date..end_date. It stops at the
+    bottom of the history, at the first message older than start_date, or
+    when the fetch is cancelled (checked between pages, and a page request
+    still in flight is aborted, see rate_limiter.FetchCancelled). Each page is handed to
+    extractors (see `extract`) and then dropped, so one pass over the history
+    can feed several result sets at once.
+
+    After each yielded page, `offset_id` and `max_message_id` describe how
+    far the crawl has got, for checkpointing. Once the loop ends, one of
+    `exhausted`, `stopped_at_start` or `cancelled` says why.
+    """
+
+    def __init__(self, client, channel, channel_name, progress_text, start_date=None, end_date=None, offset_id=0, min_id=0, max_message_id=None, limit=100, reporter=None):
+        self.client = client
+        self.channel = channel
+        self.channel_name = channel_name
+        self.progress_text = progress_text
+        self.start_date = start_date
+        self.end_date = end_date
+        self.offset_id = offset_id
+        self.min_id = min_id
+        self.max_message_id = min_id if max_message_id is None else max_message_id
+        self.limit = limit
+        self.reporter = reporter or StreamlitReporter()
+        self.exhausted = self.stopped_at_start = self.cancelled = False
+
+    def in_range(self, message_datetime):
+        return ((not self.start_date or (message_datetime and message_datetime.date() >= self.start_date)) and
+                (not self.end_date or (message_datetime and message_datetime.date() <= self.end_date)))
+
+    async def pages(self):
+        limiter = limiter_for(self.client)
+        while True:
+            # Jump straight to end_date on the first page instead of paging down from the newest message.
+            offset_date = end_date_offset(self.end_date) if self.offset_id == 0 else None
+            try:
+                messages = await limiter.call(self.client.get_messages, self.channel, limit=self.limit, offset_id=self.offset_id, offset_date=offset_date, min_id=self.min_id)
+            except FetchCancelled:
+                # The request was aborted mid-flight; end the crawl as a cancel at a page boundary would.
+                self.progress_text.write("Canceled by user.")
+                self.cancelled = True
+                return
+            if not messages:
+                self.progress_text.write("No more messages in this batch.")
+                self.exhausted = True
+                return
+            self.max_message_id = max(self.max_message_id, messages[0].id)
+
+            # Update the progress message with a batch summary.
+            first_date = messages[0].date.replace(tzinfo=None) if messages[0].date else "Unknown"
+            last_date = messages[-1].date.replace(tzinfo=None) if messages[-1].date else "Unknown"
+            self.progress_text.write(f"Processing messages for **{self.channel_name}** from {first_date.date()} to {last_date.date()}")
+
+            page = []
+            for message in messages:
+                message_datetime = message.date.replace(tzinfo=None) if message.date else None
+                # If we've reached messages older than our start_date, stop after this page.
+                if self.start_date and message_datetime and message_datetime.date() < self.start_date:
+                    self.progress_text.write("Reached messages older than the start date.")
+                    self.stopped_at_start = True
+                    break
+                # Only pass on messages within the specified range
+                if self.in_range(message_datetime):
+                    page.append(message)
+
+            self.offset_id = messages[-1].id
+            # Only the in-range messages outlive the request; extractors drop them after the page.
+            del messages
+            yield page
+            if self.stopped_at_start:
+                return
+
+            # Check if a cancel flag was set:
+            if self.reporter.cancelled():
+                self.progress_text.write("Canceled by user.")
+                self.cancelled = True
+                return
+
+    async def extract(self, *extractors):
+        """Runs the whole crawl, handing every page to each extractor's add_messages(messages, channel)."""
+        async for page in self.pages():
+            for extractor in extractors:
+                extractor.add_messages(page, self.channel)
@@ -0,0 +1,123 @@
+import csv
+import json
+import os
+import re
+import secrets
+import sqlite3
+from datetime import datetime
+import pandas as pd
+
+# Define where file-backed sinks write participants
+PARTICIPANTS_DIR = "tgforge_participants"
+PARTICIPANTS_DB_PATH = "tgforge_participants.db"
+
+def new_run_id():
+    """Returns a sortable ID for one fetch of one group, so concurrent fetches never share sink output."""
+    return f"{datetime.utcnow():%Y%m%dT%H%M%S}_{secrets.token_hex(3)}"
+
+class MemorySink:
+    """Keeps participant rows in a list (the original behaviour)."""
+
+    def __init__(self, group_name):
+        self.group_name = group_name
+        self.count = 0
+        self._rows = []
+
+    def write(self, rows):
+        self._rows.extend(rows)
+        self.count += len(rows)
+
+    def close(self):
+        pass
+
+    def result(self):
+        return pd.DataFrame(self._rows)
+
+class CsvSink:
+    """
+    Appends participant rows to `<directory>/participants_<group>_<run ID>.csv`,
+    flushing after every page. Each fetch writes its own file.
+    """
+
+    def __init__(self, group_name, directory=PARTICIPANTS_DIR):
+        self.group_name = group_name
+        self.count = 0
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"participants_{re.sub(r'[^A-Za-z0-9_.-]+', '_', group_name)}_{new_run_id()}.csv")
+        self._file = open(self.path, "w", newline="", encoding="utf-8")
+        self._writer = None
+
+    def write(self, rows):
+        if not rows:
+            return
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._file, fieldnames=list(rows[0]))
+            self._writer.writeheader()
+        self._writer.writerows(rows)
+        self._file.flush()
+        self.count += len(rows)
+
+    def close(self):
+        self._file.close()
+
+    def result(self):
+        return pd.read_csv(self.path) if self.count else pd.DataFrame()
+
+class SqliteSink:
+    """
+    Upserts participant rows into `tgforge_participants.db`, committing after
+    every page. Rows are keyed by run, so concurrent fetches of the same group
+    never overwrite each other. A run that finishes replaces the group's
+    earlier finished snapshots; runs still in progress are left alone.
+    """
+
+    def __init__(self, group_name, path=PARTICIPANTS_DB_PATH):
+        self.group_name = group_name
+        self.count = 0
+        self.path = path
+        self.run_id = new_run_id()
+        self._conn = sqlite3.connect(path, timeout=30)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS participant_runs (
+                    run_id TEXT PRIMARY KEY,
+                    group_name TEXT NOT NULL,
+                    finished INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS participant_rows (
+                    run_id TEXT NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    row TEXT NOT NULL,
+                    PRIMARY KEY (run_id, user_id)
+                )
+            """)
+            self._conn.execute("INSERT INTO participant_runs (run_id, group_name) VALUES (?, ?)", (self.run_id, group_name))
+
+    def write(self, rows):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO participant_rows VALUES (?, ?, ?)",
+                [(self.run_id, row["User ID"], json.dumps(row, default=str)) for row in rows],
+            )
+        self.count += len(rows)
+
+    def close(self):
+        with self._conn:
+            self._conn.execute("UPDATE participant_runs SET finished = 1 WHERE run_id = ?", (self.run_id,))
+            stale = "SELECT run_id FROM participant_runs WHERE group_name = ? AND finished = 1 AND run_id < ?"
+            self._conn.execute(f"DELETE FROM participant_rows WHERE run_id IN ({stale})", (self.group_name, self.run_id))
+            self._conn.execute(f"DELETE FROM participant_runs WHERE run_id IN ({stale})", (self.group_name, self.run_id))
+        self._conn.close()
+
+    def result(self):
+        with sqlite3.connect(self.path, timeout=30) as conn:
+            records = conn.execute("SELECT row FROM participant_rows WHERE run_id = ? ORDER BY rowid", (self.run_id,))
+            return pd.DataFrame([json.loads(record) for (record,) in records])
+
+SINKS = {"memory": MemorySink, "csv": CsvSink, "sqlite": SqliteSink}
+
+def open_sink(kind, group_name):
+    """Returns a new sink of `kind` ("memory", "csv" or "sqlite") for one group's participants."""
+    return SINKS[kind](group_name)
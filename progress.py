@@ -0,0 +1,146 @@
+import sys
+import threading
+import time
+from collections import deque
+import streamlit as st
+
+class StreamlitReporter:
+    """
+    Writes fetch progress straight into the running Streamlit script.
+
+    Every fetcher takes a `reporter`. `line()` returns a placeholder whose
+    write/error calls replace its text. `write`/`error` add a message.
+    `cancelled()` tells the fetch loops to stop, and `add_rows` receives rows
+    as they are collected (ignored here).
+    """
+
+    def line(self):
+        return st.empty()
+
+    def write(self, text):
+        st.write(text)
+
+    def error(self, text):
+        st.error(text)
+
+    def cancelled(self):
+        return st.session_state.get("cancel_fetch", False)
+
+    def add_rows(self, rows):
+        pass
+
+class ProgressLine:
+    """A progress line owned by a JobReporter; write/error replace its text."""
+
+    def __init__(self, reporter, index):
+        self.reporter = reporter
+        self.index = index
+
+    def write(self, text):
+        self.reporter._set(self.index, str(text), False)
+
+    def error(self, text):
+        self.reporter._set(self.index, str(text), True)
+
+class JobReporter:
+    """
+    Collects the progress of a fetch running outside the Streamlit script
+    (see jobs.py), so any later rerun can render it. Lines and rows are
+    appended from the job's thread and read from the script's, under a lock.
+    Rows are only counted, and the last `keep_rows` kept for a preview; the
+    full rows reach the UI through the job's result.
+    """
+
+    def __init__(self, keep_rows=100):
+        self._lock = threading.Lock()
+        self._lines = []  # (text, is_error)
+        self._rows = deque(maxlen=keep_rows)
+        self._row_count = 0
+        self.cancel_requested = False
+
+    def _set(self, index, text, is_error):
+        with self._lock:
+            self._lines[index] = (text, is_error)
+
+    def line(self):
+        with self._lock:
+            self._lines.append(("", False))
+            return ProgressLine(self, len(self._lines) - 1)
+
+    def write(self, text):
+        self.line().write(text)
+
+    def error(self, text):
+        self.line().error(text)
+
+    def cancelled(self):
+        return self.cancel_requested
+
+    def add_rows(self, rows):
+        with self._lock:
+            self._rows.extend(rows)
+            self._row_count += len(rows)
+
+    def lines(self):
+        """Returns the non-empty (text, is_error) lines so far."""
+        with self._lock:
+            return [line for line in self._lines if line[0]]
+
+    def rows(self, last=None):
+        """Returns a copy of the most recent rows kept, or of the `last` ones."""
+        with self._lock:
+            rows = list(self._rows)
+        return rows[-last:] if last else rows
+
+    def row_count(self):
+        with self._lock:
+            return self._row_count
+
+class ConsoleLine:
+    """A progress line of a ConsoleReporter; each write prints a new log line."""
+
+    def __init__(self, reporter, index):
+        self.reporter = reporter
+        self.index = index
+
+    def write(self, text):
+        self.reporter._print(f"[{self.index}] {text}")
+
+    def error(self, text):
+        self.reporter._print(f"[{self.index}] ERROR: {text}")
+
+class ConsoleReporter:
+    """
+    Logs fetch progress to a stream (stderr by default) for headless runs
+    (see cli.py). Rows are only counted, and `cancel_requested` is set by the
+    CLI's Ctrl+C handler.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self.cancel_requested = False
+        self._lines = 0
+        self._rows = 0
+
+    def _print(self, text):
+        # Progress text is written as Markdown for the UI; drop the bold markers.
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {str(text).replace('**', '')}", file=self.stream, flush=True)
+
+    def line(self):
+        self._lines += 1
+        return ConsoleLine(self, self._lines)
+
+    def write(self, text):
+        self._print(text)
+
+    def error(self, text):
+        self._print(f"ERROR: {text}")
+
+    def cancelled(self):
+        return self.cancel_requested
+
+    def add_rows(self, rows):
+        self._rows += len(rows)
+
+    def row_count(self):
+        return self._rows
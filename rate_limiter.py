@@ -0,0 +1,183 @@
+import asyncio
+import contextvars
+import threading
+import time
+import weakref
+from telethon.errors import FloodWaitError
+
+class AccountThrottled(Exception):
+    """Raised instead of waiting when an account's FloodWait is longer than its limiter's max_flood_wait."""
+
+    def __init__(self, seconds):
+        super().__init__(f"Account is in a FloodWait for {seconds:.0f}s")
+        self.seconds = seconds
+
+class FetchCancelled(Exception):
+    """Raised by RateLimiter.call once the fetch it belongs to has been cancelled (see set_cancel_event)."""
+
+    def __init__(self):
+        super().__init__("Canceled by user.")
+
+# The cancel event of the fetch running in the current task; tasks it starts inherit it.
+_cancel_event = contextvars.ContextVar("cancel_event", default=None)
+
+# Set by ClientPool.run for the work it runs on an account (see set_max_flood_wait).
+_pool_max_flood_wait = contextvars.ContextVar("pool_max_flood_wait", default=None)
+
+def set_max_flood_wait(seconds):
+    """
+    Makes flood waits longer than `seconds` raise AccountThrottled in the
+    current task and the tasks it starts, on every limiter whose own
+    max_flood_wait is unset. Returns a token for reset_max_flood_wait.
+    """
+    return _pool_max_flood_wait.set(seconds)
+
+def reset_max_flood_wait(token):
+    _pool_max_flood_wait.reset(token)
+
+def set_cancel_event(event):
+    """
+    Ties the current task, and every task it starts, to `event` (an
+    asyncio.Event): once it is set, RateLimiter.call raises FetchCancelled,
+    aborting RPCs and flood-wait sleeps that are already in flight.
+    """
+    _cancel_event.set(event)
+
+async def until_cancelled(awaitable):
+    """Awaits `awaitable`, or raises FetchCancelled as soon as the current fetch's cancel event is set."""
+    event = _cancel_event.get()
+    if event is None:
+        return await awaitable
+    if event.is_set():
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise FetchCancelled()
+    task = asyncio.ensure_future(awaitable)
+    cancelled = asyncio.ensure_future(event.wait())
+    try:
+        await asyncio.wait([task, cancelled], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        cancelled.cancel()
+        if not task.done():
+            task.cancel()
+    if not task.done():
+        raise FetchCancelled()
+    return task.result()
+
+class RateLimiter:
+    """
+    Awaitable token bucket shared by every RPC made through one client.
+
+    Requests are spaced at `rate` calls per second with bursts of up to `burst`
+    calls. Telegram does not publish its limits, so the rate probes for them:
+    while callers are waiting on the bucket, each successful call multiplies
+    the rate by 1 + `growth` until the first FloodWaitError, and adds
+    `recovery` to it after that. A FloodWaitError pauses the bucket for
+    everyone for the requested number of seconds and halves the rate, so
+    throughput settles just under the limit Telegram actually enforces.
+    `max_rate`, if set, caps the rate regardless.
+
+    With `max_flood_wait` set, a flood wait longer than that many seconds
+    raises AccountThrottled instead of sleeping, so the work can move to
+    another account. ClientPool sets it only for the work it runs (see
+    set_max_flood_wait), so the same client keeps sleeping through flood
+    waits when it is used on its own.
+    """
+
+    def __init__(self, rate=10.0, max_rate=None, min_rate=0.2, burst=5, recovery=0.05, max_retries=5, max_flood_wait=None, growth=0.02):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.recovery = recovery
+        self.growth = growth
+        self.max_retries = max_retries
+        self.max_flood_wait = max_flood_wait
+        self.flood_waits = 0
+        self.calls = 0
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        # Reservations are computed synchronously, so a plain lock is enough and the
+        # bucket can be shared by event loops running in different Streamlit threads.
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Takes one token and returns how long the caller has to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            if now > self._updated:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+            self._tokens -= 1
+            ready_at = self._updated + max(0.0, -self._tokens) / self.rate
+            return max(0.0, ready_at - now)
+
+    async def acquire(self):
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def on_flood_wait(self, seconds):
+        """Blocks the bucket for `seconds` and backs the rate off."""
+        with self._lock:
+            now = time.monotonic()
+            # Calls already in flight when the bucket closed hit the same limit;
+            # back off once per flood wait, not once per call.
+            if self._updated <= now:
+                self.flood_waits += 1
+                self.rate = max(self.min_rate, self.rate / 2)
+            self._updated = max(self._updated, now + seconds)
+            self._tokens = min(self._tokens, 0.0)
+
+    def on_success(self):
+        with self._lock:
+            self.calls += 1
+            # Only a rate that is holding callers back tells us anything about the limit.
+            if self._tokens >= 1:
+                return
+            if self.flood_waits:
+                self.rate += self.recovery
+            else:
+                self.rate *= 1 + self.growth
+            if self.max_rate is not None:
+                self.rate = min(self.max_rate, self.rate)
+
+    def blocked_for(self):
+        """Seconds until the bucket reopens after a flood wait (0 if it is open)."""
+        with self._lock:
+            return max(0.0, self._updated - time.monotonic())
+
+    async def call(self, func, *args, **kwargs):
+        """
+        Awaits `func(*args, **kwargs)` under the limiter, retrying on FloodWaitError.
+        Raises FetchCancelled right away if the calling fetch is cancelled meanwhile.
+        """
+        return await until_cancelled(self._call(func, *args, **kwargs))
+
+    async def _call(self, func, *args, **kwargs):
+        max_flood_wait = self.max_flood_wait if self.max_flood_wait is not None else _pool_max_flood_wait.get()
+        for attempt in range(self.max_retries + 1):
+            if max_flood_wait is not None and self.blocked_for() > max_flood_wait:
+                raise AccountThrottled(self.blocked_for())
+            await self.acquire()
+            try:
+                result = await func(*args, **kwargs)
+            except FloodWaitError as e:
+                self.on_flood_wait(e.seconds + 1)
+                if max_flood_wait is not None and e.seconds > max_flood_wait:
+                    raise AccountThrottled(e.seconds) from e
+                if attempt == self.max_retries:
+                    raise
+                continue
+            self.on_success()
+            return result
+
+# One limiter per client: Telegram's limits apply per account, not per process.
+_limiters = weakref.WeakKeyDictionary()
+
+def limiter_for(client):
+    """Returns the shared RateLimiter for `client`, creating it on first use."""
+    limiter = _limiters.get(client)
+    if limiter is None:
+        limiter = _limiters[client] = RateLimiter()
+    return limiter
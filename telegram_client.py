@@ -1,13 +1,72 @@
 from telethon import TelegramClient
+from telethon.sessions import StringSession
+import asyncio
+import hashlib
 import os
+import secrets
+import sys
+import time
 import streamlit as st
+from rate_limiter import AccountThrottled, limiter_for, reset_max_flood_wait, set_max_flood_wait, until_cancelled
 
-# Define session file path
+# Define session file path (named sessions, e.g. extra pool accounts)
 SESSION_PATH = "my_telegram_session"
+# Per-user sessions are kept here as StringSession strings, one file per browser session key.
+SESSION_DIR = "tgforge_sessions"
+
+# Cookie that keeps the session key across page reloads, and how long it lasts.
+SESSION_COOKIE = "tgforge_sid"
+SESSION_COOKIE_MAX_AGE = 30 * 24 * 3600
+
+def user_session_key():
+    """
+    Returns the key of this browser session's Telegram session. It is kept in
+    a cookie so a page reload finds the same session, and every other browser
+    gets its own key, so analysts never share a session file. The key stays
+    out of the URL, where browser history, shared links and screenshots would
+    give the session away.
+    """
+    if "sid" in st.query_params:
+        # Earlier versions put the key in the URL; drop it and don't honour it, so such a link signs in afresh.
+        del st.query_params["sid"]
+    cookie = st.context.cookies.get(SESSION_COOKIE)
+    if "session_key" not in st.session_state:
+        st.session_state.session_key = cookie or secrets.token_urlsafe(24)
+    key = st.session_state.session_key
+    if cookie != key:
+        # Streamlit cannot set cookies itself, so the page does; the server reads it on the next page load.
+        st.html(
+            f"<script>document.cookie = '{SESSION_COOKIE}={key}; path=/; max-age={SESSION_COOKIE_MAX_AGE}; SameSite=Strict'"
+            " + (location.protocol === 'https:' ? '; Secure' : '');</script>",
+            unsafe_allow_javascript=True,
+        )
+    return key
+
+def user_session_path(key):
+    # The key itself never reaches the disk.
+    return os.path.join(SESSION_DIR, f"{hashlib.sha256(key.encode()).hexdigest()[:32]}.session")
+
+def load_user_session(key):
+    """Returns the StringSession saved under `key`, or a new empty one."""
+    try:
+        with open(user_session_path(key), encoding="utf-8") as f:
+            return StringSession(f.read().strip())
+    except OSError:
+        return StringSession()
+
+def save_user_session(client, key):
+    """Writes the client's StringSession under `key`, readable only by the app's user."""
+    os.makedirs(SESSION_DIR, exist_ok=True)
+    path = user_session_path(key)
+    tmp_path = f"{path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(StringSession.save(client.session))
+    os.replace(tmp_path, path)
 
 # Function to delete session file and log out user
 def delete_session_file():
-    session_file = f"{SESSION_PATH}.session"
+    session_file = user_session_path(user_session_key())
     if os.path.exists(session_file):
         os.remove(session_file)
     st.session_state.authenticated = False
@@ -16,5 +75,141 @@ def delete_session_file():
     st.success("Session reset successfully. Start again.")
 
 # Function to create a Telegram client
-def create_client(api_id, api_hash):
-    return TelegramClient(SESSION_PATH, api_id, api_hash)
\ No newline at end of file
+def create_client(api_id, api_hash, session=None):
+    # Without a session name, use this browser session's own in-memory StringSession.
+    if session is None:
+        session = load_user_session(user_session_key())
+    # Flood waits are surfaced to rate_limiter instead of being slept through inside
+    # Telethon, so every coroutine sharing the client backs off together.
+    return TelegramClient(session, api_id, api_hash, flood_sleep_threshold=0)
+
+class ClientPool:
+    """
+    Several authorized accounts that share a crawl.
+
+    Telegram rate-limits each account separately, so `run` hands each unit of
+    work (one channel) to the account whose limiter reopens soonest, with the
+    fewest jobs in progress. While it runs work for the pool, an account's
+    limiter raises AccountThrottled instead of sleeping through a flood wait
+    longer than `max_flood_wait` seconds; outside the pool it sleeps as usual. The work is then retried on another account, and crawls resume
+    from their checkpoint. When every account is throttled, the pool waits
+    for the first one to reopen.
+    """
+
+    def __init__(self, clients, labels=None, max_flood_wait=30):
+        self.clients = list(clients)
+        self.labels = list(labels) if labels else [f"Account {i + 1}" for i in range(len(self.clients))]
+        self.active = [0] * len(self.clients)
+        self.handoffs = 0
+        self.started = time.monotonic()
+        self.max_flood_wait = max_flood_wait
+        # Limiters outlive the pool when its clients are shared, so throughput counts from here.
+        self._baseline = [(limiter_for(client).calls, limiter_for(client).flood_waits) for client in self.clients]
+
+    def __len__(self):
+        return len(self.clients)
+
+    def pick(self, exclude=()):
+        """Returns the index of the account that can take work soonest."""
+        candidates = [i for i in range(len(self.clients)) if i not in exclude] or range(len(self.clients))
+        return min(candidates, key=lambda i: (limiter_for(self.clients[i]).blocked_for(), self.active[i]))
+
+    async def run(self, work):
+        """Awaits `work(client)` on the best account, moving it to another account whenever one is throttled."""
+        throttled = set()
+        while True:
+            index = self.pick(exclude=throttled)
+            wait = limiter_for(self.clients[index]).blocked_for()
+            if wait > 0:
+                await until_cancelled(asyncio.sleep(wait))
+            self.active[index] += 1
+            token = set_max_flood_wait(self.max_flood_wait)
+            try:
+                return await work(self.clients[index])
+            except AccountThrottled:
+                self.handoffs += 1
+                throttled.add(index)
+                if len(throttled) == len(self.clients):
+                    throttled = set()
+            finally:
+                reset_max_flood_wait(token)
+                self.active[index] -= 1
+
+    async def close(self, keep=None):
+        """
+        Disconnects the pool's accounts, except `keep` (e.g. the signed-in
+        client, still used afterwards) and the shared extra-session clients,
+        which other jobs may be using (see disconnect_shared_clients).
+        """
+        for client in self.clients:
+            if client is not keep and client not in _shared_clients.values():
+                await client.disconnect()
+
+    def throughput(self):
+        """Per-account request counts, flood waits and requests per second since the pool was created."""
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        rows = []
+        for label, client, (calls, flood_waits) in zip(self.labels, self.clients, self._baseline):
+            limiter = limiter_for(client)
+            rows.append({
+                "Account": label,
+                "Requests": limiter.calls - calls,
+                "Flood Waits": limiter.flood_waits - flood_waits,
+                "Current Rate (req/s)": round(limiter.rate, 2),
+                "Throughput (req/s)": round((limiter.calls - calls) / elapsed, 2),
+            })
+        return rows
+
+# One connected client per extra session name, shared by every job in the process: a second
+# client would open the same SQLite session file again and get its own rate limiter.
+_shared_clients = {}
+_shared_clients_lock = None
+
+async def shared_client(api_id, api_hash, session):
+    """Returns the process-wide connected client for the named `session`, or None if it is not authorized."""
+    global _shared_clients_lock
+    if _shared_clients_lock is None:
+        _shared_clients_lock = asyncio.Lock()
+    async with _shared_clients_lock:
+        client = _shared_clients.get(session)
+        if client is None:
+            client = create_client(api_id, api_hash, session)
+        if not client.is_connected():
+            await until_cancelled(client.connect())
+        if not await until_cancelled(client.is_user_authorized()):
+            _shared_clients.pop(session, None)
+            await client.disconnect()
+            return None
+        _shared_clients[session] = client
+        return client
+
+async def disconnect_shared_clients():
+    """Disconnects the shared extra-session clients, e.g. when a CLI run ends."""
+    while _shared_clients:
+        _, client = _shared_clients.popitem()
+        await client.disconnect()
+
+async def connect_pool(api_id, api_hash, client, sessions):
+    """
+    Builds a ClientPool from the signed-in `client` plus any extra session
+    names that are already authorized (see `python telegram_client.py SESSION`).
+    The extra sessions' clients are shared with other jobs and stay connected
+    after the pool is closed. Returns the pool and the session names that
+    were skipped.
+    """
+    clients, labels, skipped = [client], ["This session"], []
+    for session in sessions:
+        extra = await shared_client(api_id, api_hash, session)
+        if extra is not None:
+            clients.append(extra)
+            labels.append(session)
+        else:
+            skipped.append(session)
+    return ClientPool(clients, labels), skipped
+
+if __name__ == "__main__":
+    # Authorizes an extra session for the client pool from a terminal:
+    #   python telegram_client.py SESSION_NAME API_ID API_HASH
+    session, api_id, api_hash = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+    create_client(api_id, api_hash, session).start()
+    print(f"Session '{session}' is authorized.")
\ No newline at end of file
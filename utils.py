@@ -0,0 +1,32 @@
+from datetime import datetime, time, timedelta, timezone
+from telethon.tl.types import MessageEntityHashtag, MessageEntityTextUrl, MessageEntityUrl
+
+def end_date_offset(end_date):
+    """
+    Returns the `offset_date` that makes Telegram start paging at the end of
+    `end_date` (UTC), or None when there is no end date. Messages are returned
+    strictly older than this point, so the whole of `end_date` is included.
+    """
+    if end_date is None:
+        return None
+    return datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=timezone.utc)
+
+def extract_hashtags(message):
+    """Returns the hashtags Telegram marked in a message, in order of appearance."""
+    if not message.entities:
+        return []
+    return [text for _, text in message.get_entities_text(MessageEntityHashtag)]
+
+def extract_urls(message):
+    """
+    Returns the links Telegram marked in a message: plain URLs as written and the
+    targets of hyperlinked text. Scheme-less links (e.g. "example.com") get
+    "http://" so they parse like the rest.
+    """
+    if not message.entities:
+        return []
+    urls = []
+    for entity, text in message.get_entities_text((MessageEntityUrl, MessageEntityTextUrl)):
+        url = entity.url if isinstance(entity, MessageEntityTextUrl) else text
+        urls.append(url if "://" in url else f"http://{url}")
+    return urls